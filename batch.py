@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Analyze whole directories of audio files on a process pool, writing one JSON line per file.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent import futures
+
+from main import segments
+from observado.analyze import classifier
+
+extensions = ('.aif', '.aiff', '.au', '.flac', '.m4a', '.mp3', '.ogg', '.wav', '.wma')
+
+
+# Expand directories and glob patterns into a sorted list of audio files.
+def find(paths: list) -> list:
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.update(os.path.join(root, x) for x in names if x.lower().endswith(extensions))
+        else:
+            files.update(x for x in glob.glob(path, recursive=True) if os.path.isfile(x))
+    return sorted(os.path.abspath(x) for x in files)
+
+
+# Load the models once per worker process. They are memory maps, so workers share one copy.
+def _init():
+    try:
+        classifier()
+    except FileNotFoundError:
+        pass
+
+
+def _work(filename: str) -> dict:
+    begin = time.perf_counter()
+    try:
+        result = segments(filename)
+    except Exception as e:
+        return {'file': filename, 'error': '{}: {}'.format(type(e).__name__, e)}
+    return {'file': filename, 'duration': result[-1][1] if result else 0., 'elapsed': time.perf_counter() - begin,
+            'model': classifier().version, 'segments': result}
+
+
+def _read_manifest(path: str) -> set:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {x.rstrip('\n') for x in f if x.strip()}
+
+
+def run(files: list, output, manifest=None, workers=None) -> dict:
+    done = _read_manifest(manifest)
+    todo = [x for x in files if x not in done]
+    stats = {'files': 0, 'errors': 0, 'skipped': len(files) - len(todo), 'audio': 0., 'elapsed': 0.}
+    begin = time.perf_counter()
+    log = open(manifest, 'a', encoding='utf-8') if manifest else None
+    # Models missing or out of date are trained once, before the workers start.
+    _init()
+    try:
+        with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init) as pool:
+            for future in futures.as_completed([pool.submit(_work, x) for x in todo]):
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                output.flush()
+                stats['files'] += 1
+                if 'error' in record:
+                    stats['errors'] += 1
+                    continue
+                stats['audio'] += record['duration']
+                # Only record a file as done after its result is written.
+                if log:
+                    log.write(record['file'] + '\n')
+                    log.flush()
+    finally:
+        if log:
+            log.close()
+    stats['elapsed'] = time.perf_counter() - begin
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze directories or glob patterns of audio files.')
+    parser.add_argument('paths', nargs='+', help='directories or glob patterns')
+    parser.add_argument('-o', '--output', default='-', help='JSON lines file to append to, stdout by default')
+    parser.add_argument('-m', '--manifest', help='progress file, "<output>.done" by default when writing to a file')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    manifest = args.manifest or (args.output + '.done' if args.output != '-' else None)
+    output = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+    try:
+        stats = run(find(args.paths), output, manifest, args.workers)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = max(stats['elapsed'], 1e-9)
+    print('{} files ({} failed, {} skipped), {:.1f} s of audio in {:.1f} s: {:.2f} files/s, {:.1f} audio s/s'.format(
+        stats['files'], stats['errors'], stats['skipped'], stats['audio'], stats['elapsed'],
+        stats['files'] / elapsed, stats['audio'] / elapsed), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Fail if importing the analysis modules, or a cold start of main.run, gets slower than its budget.
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+root = os.path.join(dirname, '..')
+# Seconds of cumulative import time by "python -X importtime". The observado package is a namespace package,
+# empty to import, so its modules are budgeted.
+budgets = {'observado.hmm': 0.25, 'observado.analyze': 0.25, 'main': 0.5}
+# Modules only needed for plotting, training or generating data
+forbidden = ('matplotlib', 'pandas', 'sklearn', 'tqdm')
+
+
+# Cumulative import time of a module in seconds, and all modules imported with it.
+def importtime(module: str) -> (float, set):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=root,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0.
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if name.strip() == module and not name[1:].startswith(' '):
+            total = int(cumulative) / 1e6
+    return total, modules
+
+
+def cold_start(filename: str) -> float:
+    begin = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import main; main.run({!r})'.format(filename)], cwd=root,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check import time and cold start against budgets.')
+    parser.add_argument('--file', help='audio file for the cold start of main.run, skipped if not given')
+    parser.add_argument('--run-budget', type=float, default=10., help='seconds for the cold start of main.run')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs is compared')
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in budgets.items():
+        results = [importtime(module) for _ in range(args.repeat)]
+        seconds = min(x[0] for x in results)
+        loaded = sorted(x for x in results[0][1] if x.split('.')[0] in forbidden)
+        ok = seconds <= budget and not loaded
+        failed |= not ok
+        print('{} import {}: {:.3f} s (budget {:.3f} s){}'.format('OK  ' if ok else 'FAIL', module, seconds, budget,
+                                                                  ', loads ' + ', '.join(loaded) if loaded else ''))
+    if args.file:
+        seconds = min(cold_start(args.file) for _ in range(args.repeat))
+        ok = seconds <= args.run_budget
+        failed |= not ok
+        print('{} main.run: {:.3f} s (budget {:.3f} s)'.format('OK  ' if ok else 'FAIL', seconds, args.run_budget))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Time each stage of the analysis on synthetic chord progressions of several lengths, with peak memory,
+# and fail if any stage got slower or bigger than a stored baseline, or streaming is too slow for real time.
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import librosa
+import numpy as np
+import scipy
+import scipy.io.wavfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from observado import analyze, hmm, stream  # noqa: E402
+from observado.lib import utils  # noqa: E402
+
+sr = 22050
+# Seconds of audio by name
+lengths = {'30s': 30, '5min': 300, '1h': 3600}
+methods = ('cqt', 'stft', 'cens', 'enhanced_cqt')
+
+
+# Reproducible progression of chords of utils.chord_table, "duration" seconds each, as a mono waveform.
+def synthesize(seconds: float, duration=2., seed=0) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    qualities = list(utils.chord_table.keys())
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    envelope = np.minimum(t / .01, 1) * np.exp(-t / 1.5)
+    harmonics = np.array([1, .5, .3, .2])
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    for start in range(0, len(y), n):
+        root = rng.randint(12)
+        pattern = utils.chord_table[qualities[rng.randint(len(qualities))]]
+        notes = [60 + root + x for x in np.flatnonzero(pattern)] + [48 + root]
+        frequency = 440. * 2 ** ((np.array(notes)[:, np.newaxis] - 69) / 12) * np.arange(1, len(harmonics) + 1)
+        wave = harmonics.dot(np.sin(2 * np.pi * frequency[:, :, np.newaxis] * t).sum(axis=0))
+        chunk = envelope * wave / len(notes) * .5 + rng.normal(0, .005, n)
+        y[start:start + n] = chunk[:len(y) - start]
+    return y
+
+
+# Run the stages of the analysis on a file, calling measure(name, function, *args) for each of them.
+def pipeline(filename: str, measure):
+    y, _ = measure('load', librosa.load, filename)
+    harmonic = measure('harmonic', librosa.effects.harmonic, y, margin=4)
+    for method in methods:
+        measure('chroma.' + method, utils.chroma, harmonic, method)
+    chroma = measure('features', utils.features, y, ('cens',), 4)['cens']
+    chords, _, frames = measure('analyze_hmm', hmm.analyze_hmm, chroma)
+    try:
+        analyze.classifier()
+    except FileNotFoundError:
+        print('No trained models, skipping analyze', file=sys.stderr)
+        return
+    measure('analyze', analyze.analyze, chroma, chords, frames)
+    measure('stream', lambda x: list(stream.records(stream.read_blocks(x))), filename)
+
+
+# Best wall time of "repeat" runs of each stage, and peak traced allocation of one more run.
+def bench(filename: str, repeat=3, memory=True) -> dict:
+    results = {}
+
+    def measure(name, function, *args, **kwargs):
+        seconds = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds.append(time.perf_counter() - begin)
+        results[name] = {'seconds': min(seconds)}
+        if memory:
+            tracemalloc.start()
+            result = function(*args, **kwargs)
+            results[name]['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print('  {:<20} {:8.3f} s {:>10}'.format(name, results[name]['seconds'], '{:.1f} MB'.format(
+            results[name]['peak'] / 2 ** 20) if memory else ''), file=sys.stderr)
+        return result
+
+    pipeline(filename, measure)
+    return results
+
+
+# Stages slower or bigger than the baseline by more than "threshold" as a fraction.
+# Stages under "floor" seconds are too noisy to compare in time.
+def compare(results: dict, baseline: dict, threshold=.2, floor=.01) -> list:
+    regressions = []
+    for length, stages in results['results'].items():
+        for name, result in stages.items():
+            base = baseline['results'].get(length, {}).get(name)
+            if base is None:
+                continue
+            for key in ('seconds', 'peak'):
+                if key not in result or key not in base or (key == 'seconds' and base[key] < floor):
+                    continue
+                if result[key] > base[key] * (1 + threshold):
+                    regressions.append('{} {} {}: {:.4g} against {:.4g} (+{:.0%})'.format(
+                        length, name, key, result[key], base[key], result[key] / base[key] - 1))
+    return regressions
+
+
+# Lengths where streaming runs at less than "speed" times real time.
+def slow(results: dict, speed=4.) -> list:
+    failures = []
+    for length, stages in results['results'].items():
+        if 'stream' in stages and stages['stream']['seconds'] * speed > lengths[length]:
+            failures.append('{} stream: {:.4g} s, {:.1f} times real time'.format(
+                length, stages['stream']['seconds'], lengths[length] / stages['stream']['seconds']))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the analysis on synthetic audio.')
+    parser.add_argument('--lengths', nargs='+', choices=lengths.keys(), default=['30s', '5min'],
+                        help='lengths of audio, "1h" takes a long time')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs is recorded')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='do not trace peak memory')
+    parser.add_argument('-o', '--output', help='JSON file to write results to, stdout by default')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=.2, help='fraction of slowdown counted as a regression')
+    parser.add_argument('--speed', type=float, default=4., help='times real time streaming must run at least')
+    args = parser.parse_args()
+
+    results = {'versions': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'scipy': scipy.__version__, 'librosa': librosa.__version__},
+               'machine': platform.machine(), 'repeat': args.repeat, 'results': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.lengths:
+            filename = os.path.join(directory, name + '.wav')
+            scipy.io.wavfile.write(filename, sr, (synthesize(lengths[name]) * 32767).astype(np.int16))
+            print(name, file=sys.stderr)
+            results['results'][name] = bench(filename, args.repeat, args.memory)
+            os.remove(filename)
+    results['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    regressions = slow(results, args.speed)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions += compare(results, json.load(f), args.threshold)
+    for x in regressions:
+        print('REGRESSION ' + x, file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
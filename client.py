@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Thin client of server.py printing the same "start time, end time, chord" text as main.py.
+# It only imports the standard library, so the analysis runs warm in the server.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+host = '127.0.0.1'
+port = 5125
+# Seconds a server started by the client waits for another request before exiting
+idle = 600
+
+
+def request(filename: str, address: tuple) -> list:
+    with socket.create_connection(address) as sock:
+        with sock.makefile('rw', encoding='utf-8', newline='\n') as f:
+            f.write(json.dumps({'id': 0, 'file': filename}) + '\n')
+            f.flush()
+            line = f.readline()
+    if not line:
+        raise ConnectionError('Server closed the connection.')
+    response = json.loads(line)
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['segments']
+
+
+# Start the server in the background, detached from this process. It exits once idle for "idle" seconds,
+# so that it only outlives its clients by that long.
+def spawn(address: tuple):
+    args = [sys.executable, os.path.join(dirname, 'server.py'), '--host', address[0], '--port', str(address[1]),
+            '--idle', str(idle)]
+    kwargs = {'creationflags': subprocess.DETACHED_PROCESS} if os.name == 'nt' else {'start_new_session': True}
+    subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     cwd=dirname, **kwargs)
+
+
+def connect(filename: str, address: tuple, wait: float) -> list:
+    try:
+        return request(filename, address)
+    except ConnectionRefusedError:
+        spawn(address)
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return request(filename, address)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a file with the chord analysis server.')
+    parser.add_argument('file', nargs='?', default='')
+    parser.add_argument('--host', default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--wait', type=float, default=60, help='seconds to wait for a newly started server')
+    args = parser.parse_args()
+
+    filename = os.path.abspath(args.file) if args.file else ''
+    try:
+        result = connect(filename, (args.host, args.port), args.wait)
+    except ConnectionError:
+        # No server available, analyze in this process instead.
+        sys.path.insert(0, dirname)
+        from main import segments
+        result = segments(filename)
+    print('\n'.join('{:.2f} {:.2f} {}'.format(*x) for x in result))
+
+
+if __name__ == '__main__':
+    main()
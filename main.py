@@ -1,34 +1,178 @@
 #!/usr/bin/env python3
+import argparse
 import sys
+from functools import partial
+from typing import Iterator, Optional
 
 import librosa
+import numpy as np
 
 from observado.analyze import analyze
-from observado.hmm import analyze_hmm
-from observado.lib import utils
+from observado.hmm import analyze_hmm, vocabularies
+from observado.lib import chords as codes, profile, utils
+from observado.lib.cache import FeatureCache
+from observado.lib.segment import Segment, write_jsonl
 
+cache = FeatureCache()
 
-def run(filename: str) -> str:
+
+# Load a file at most once, when first needed.
+def loader(filename: str):
+    signal = []
+
+    def load() -> np.ndarray:
+        if not signal:
+            with profile.stage('load'):
+                signal.append(librosa.load(filename)[0])
+        return signal[0]
+
+    return load
+
+
+# Chromagram of the harmonic part of a file, computed once per file content.
+# With "jobs", it is computed in windows across that many processes.
+def chroma(filename: str, load=None, jobs: Optional[int] = None):
+    load = load or loader(filename)
+    windows = {}
+    if jobs:
+        from observado import parallel
+
+        windows['windows'] = 'cens {} {}'.format(parallel.window, parallel.margin)
+
+    def compute():
+        y = load()
+        with profile.stage('features'):
+            if jobs:
+                return parallel.chromagram(y, jobs=jobs)
+            return utils.features(y, ('cens',), margin=4)['cens']
+
+    return cache.fetch(filename, compute, method='cens', bins_per_octave=36, margin=4, hpss='spectral', sr=22050,
+                       librosa=librosa.__version__, **windows)
+
+
+# Frames of the beats of a file, tracked on its onset envelope.
+def beat_frames(filename: str, load=None) -> np.ndarray:
+    load = load or loader(filename)
+
+    def compute():
+        y = load()
+        with profile.stage('beats'):
+            return utils.beats(None, utils.onset(y))[0]
+
+    return np.asarray(cache.fetch(filename, compute, method='beats', aggregate='median', sr=22050,
+                                  librosa=librosa.__version__)).astype(int)
+
+
+# Decode chords on the beat grid: the HMM runs on the mean chroma between beats instead of every frame,
+# and chords change on beats. Returns the same as analyze_hmm.
+def analyze_beats(c: np.ndarray, beats: np.ndarray, vocabulary=None, same_root: Optional[float] = None,
+                  posterior=False) -> tuple:
+    grid = np.unique(np.concatenate(([0], beats, [c.shape[1] - 1])))
+    result = analyze_hmm(utils.means(c, grid[1:-1]), durations=np.diff(grid), qualities=vocabulary,
+                         posterior=posterior, same_root=same_root)
+    frames = [int(grid[x]) for x in result[2][:-1]] + [c.shape[1] - 1]
+    return (result[0], librosa.frames_to_time(frames), frames) + result[3:]
+
+
+# Analyze a file into Segment records, with chords changing on beats if "beats" is set,
+# and the HMM recognizing the chords of a vocabulary of hmm.vocabularies, triads by default.
+# With "jobs", features are computed across that many processes, and so is the Viterbi decoding with "windows".
+# "same_root" weighs changes of quality against changes of root, by default as hmm.same_roots for the vocabulary.
+# Posterior probabilities of the chords are only computed with "posterior", and None otherwise.
+def records(filename: str, beats=False, vocabulary=None, jobs: Optional[int] = None, windows=False,
+            same_root: Optional[float] = None, posterior=False) -> Iterator[Segment]:
     if not filename:
         filename = librosa.util.example_audio_file()
-    y, _ = librosa.load(filename)
-    y = librosa.effects.harmonic(y, margin=4)
-    chroma = utils.chroma(y, 'cens')
+    load = loader(filename)
+    with profile.stage('chroma'):
+        c = chroma(filename, load, jobs)
+    decoder = None
+    if jobs and windows:
+        from observado.parallel import viterbi_windows
+
+        decoder = partial(viterbi_windows, jobs=jobs)
     # HMM analyze basic chord types (major or minor) and lasting time
-    chords, time_frames, frames = analyze_hmm(chroma)
+    with profile.stage('hmm'):
+        if beats:
+            result = analyze_beats(c, beat_frames(filename, load), vocabulary, same_root, posterior)
+        else:
+            result = analyze_hmm(c, qualities=vocabulary, posterior=posterior, decoder=decoder, same_root=same_root)
+        chords, time_frames, frames = result[:3]
+        probability = result[3] if posterior else [None] * len(chords)
     # Analyze the seventh intervals
-    chords = analyze(chroma, chords, frames)
-    s = ''
-    for i in range(len(time_frames) - 1):
-        s += '{:.2f} {:.2f} {}'.format(time_frames[i], time_frames[i + 1], chords[i])
-        if i != len(time_frames) - 2:
-            s += '\n'
-    return s
+    with profile.stage('analyze'):
+        chords, confidence = analyze(c, chords, frames, confidence=True)
+    for i, chord in enumerate(codes.decode(chords)):
+        yield Segment(float(time_frames[i]), float(time_frames[i + 1]), chord,
+                      None if probability[i] is None else float(probability[i]),
+                      None if np.isnan(confidence[i]) else float(confidence[i]))
+
+
+# Recognize chords from a file with the streaming decoder, each Segment coming as soon as it is final.
+def stream_records(filename: str, vocabulary=None, same_root: Optional[float] = None) -> Iterator[Segment]:
+    from observado import stream
+
+    return stream.records(stream.read_blocks(filename), qualities=vocabulary, same_root=same_root)
+
+
+# Analyze a file into a list of (start time, end time, chord).
+def segments(filename: str, beats=False, vocabulary=None, jobs: Optional[int] = None, windows=False,
+             same_root: Optional[float] = None) -> list:
+    return [x[:3] for x in records(filename, beats, vocabulary, jobs, windows, same_root)]
+
+
+# Format segments as lines of "start time, end time, chord".
+def text(result: list) -> str:
+    return '\n'.join('{:.2f} {:.2f} {}'.format(*x[:3]) for x in result)
+
+
+def run(filename: str, beats=False, vocabulary=None, jobs: Optional[int] = None, windows=False,
+        same_root: Optional[float] = None) -> str:
+    with profile.stage('run'):
+        return text(segments(filename, beats, vocabulary, jobs, windows, same_root))
 
 
 def main():
-    filename = sys.argv[1] if len(sys.argv) > 1 else librosa.util.example_audio_file()
-    print(run(filename))
+    parser = argparse.ArgumentParser(description='Recognize the chords of an audio file.')
+    parser.add_argument('filename', nargs='?', help='audio file, the example of librosa by default')
+    parser.add_argument('--beats', action='store_true', help='decode chords between beats instead of on every frame')
+    parser.add_argument('--vocabulary', choices=vocabularies.keys(), default='triads',
+                        help='chords recognized by the HMM, major and minor chords being refined into seventh chords')
+    parser.add_argument('--same-root', type=float, metavar='WEIGHT',
+                        help='how much more likely a change of quality on the same root is than a change to any given '
+                             'chord of another root, 2 for the full vocabulary and 1 for the others by default')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='write one JSON object per segment with its posterior and confidence')
+    parser.add_argument('--stream', action='store_true',
+                        help='decode incrementally, writing each segment as soon as it is final')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='compute features on windows of the file across that many processes')
+    parser.add_argument('--viterbi-windows', action='store_true',
+                        help='with --jobs, also decode windows of the file in parallel and join them')
+    parser.add_argument('--profile', metavar='TARGET', nargs='?', const='log',
+                        help='time each stage, logged or written as a Chrome trace if TARGET ends with .json')
+    parser.add_argument('--profile-memory', action='store_true', help='also trace allocations of each stage')
+    args = parser.parse_args()
+
+    if args.stream and args.beats:
+        parser.error('--stream does not support --beats')
+    if args.stream and args.jobs:
+        parser.error('--stream does not support --jobs')
+
+    profile.configure(args.profile, args.profile_memory)
+    filename = args.filename or librosa.util.example_audio_file()
+    if not args.jsonl and not args.stream:
+        print(run(filename, args.beats, args.vocabulary, args.jobs, args.viterbi_windows, args.same_root))
+        return
+    with profile.stage('run'):
+        result = stream_records(filename, args.vocabulary, args.same_root) if args.stream else \
+            records(filename, args.beats, args.vocabulary, args.jobs, args.viterbi_windows, args.same_root,
+                    args.jsonl)
+        if args.jsonl:
+            write_jsonl(result, sys.stdout)
+        else:
+            for segment in result:
+                print(segment.text(), flush=True)
 
 
 if __name__ == '__main__':
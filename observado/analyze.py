@@ -2,113 +2,99 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os
+from functools import lru_cache
+from typing import Optional
 
-import joblib
 import numpy as np
-import pandas as pd
-from sklearn.metrics import accuracy_score
-from sklearn.neighbors import KNeighborsClassifier
 
 import observado.lib.utils as utils
-from observado.lib.chords import Chord
+from observado.lib import chords as codes, profile
+from observado.lib.knn import KNN
 
 dirname = os.path.dirname(__file__)
 chord_table = {k: v for (k, v) in utils.chord_table.items()}
-all_chords = [(lambda x, y: x + y if y != 'M' else x)(x, y)
-              for x in utils.all_notes if x not in utils.note_alts.keys() for y in chord_table.keys()]
-
-roots = dict(zip([x for x in utils.all_notes if x not in utils.note_alts.keys()], [y for y in range(12)]))
 qualities = dict(zip([x for x in chord_table.keys()], [y for y in range(len(chord_table))]))
 qualities['N'] = len(chord_table)
-chords = dict(zip([x for x in all_chords], [y for y in range(len(all_chords))]))
-chords['N'] = len(chords)
-
-
-def _get_quality(n: int) -> str:
-    return '' if list(qualities.keys())[n] == 'M' else list(qualities.keys())[n]
-
-
-def _load_data(maj: True, wav_path=utils.cens, noise_path=utils.noise) -> (np.ndarray, np.ndarray, np.ndarray):
-    df = pd.read_csv(wav_path, usecols=lambda col: col != 'method')
-    df = df.append(pd.read_csv(noise_path), sort=False)
-    head = list(df.head())
-    # Read the number of roots and qualities for chords from CSV file.
-    # Major or minor third depends on parameter "maj".
-    a = np.array(
-        [(x[head.index('C'):head.index('B') + 1], roots[x[head.index('root')]], qualities[x[head.index('quality')]]) for
-         x in df.values if
-         x[head.index('notation')] in chords.keys() and x[head.index('root')] != 'N' and x[head.index('quality')] in (
-             ('M', '7', 'maj7') if maj else ('m', 'm7'))])
-    np.random.shuffle(a)
-    x = np.array([x[0] for x in a], dtype=np.float)
-    y = np.array([x[1] for x in a])
-    z = np.array([x[2] for x in a])
-    return x, y, z
-
-
-def _train(maj: True):
-    x_full, y_full, z_full = _load_data(maj)
-    x_train, y_train, z_train = \
-        x_full[:int(0.8 * len(x_full))], y_full[:int(0.8 * len(y_full))], z_full[:int(0.8 * len(z_full))]
-    x_test, y_test, z_test = \
-        x_full[int(0.8 * len(x_full)):], y_full[int(0.8 * len(y_full)):], z_full[int(0.8 * len(z_full)):]
-
-    if os.path.exists(os.path.join(dirname, '../data/models/major.joblib')) and os.path.exists(
-            os.path.join(dirname, '../data/models/minor.joblib')):
-        for i in range(len(x_test)):
-            x_test[i] = np.roll(x_test[i], -y_test[i])
-        if maj:
-            maj_clf = joblib.load(os.path.join(dirname, '../data/models/major.joblib'))
-            print(accuracy_score(z_test, maj_clf.predict(x_test)))
-        else:
-            min_clf = joblib.load(os.path.join(dirname, '../data/models/minor.joblib'))
-            print(accuracy_score(z_test, min_clf.predict(x_test)))
-        return
-
-    assert len(x_train) == len(y_train) == len(z_train)
-    for i in range(len(x_train)):
-        x_train[i] = np.roll(x_train[i], -y_train[i])
-    assert len(x_test) == len(y_test) == len(z_test)
-    for i in range(len(x_test)):
-        x_test[i] = np.roll(x_test[i], -y_test[i])
-
-    clf = KNeighborsClassifier()
-    clf.fit(x_train, z_train)
-    print(accuracy_score(z_test, clf.predict(x_test)))
-    joblib.dump(clf,
-                os.path.join(dirname, '../data/models/major.joblib' if maj else '../data/models/minor.joblib'))
-
-
-def analyze_chords(chroma: np.ndarray, root: str, maj: bool):
-    if not os.path.exists(os.path.join(dirname, '../data/models/major.joblib')) and os.path.exists(
-            os.path.join(dirname, '../data/models/minor.joblib')):
-        _train(True)
-        _train(False)
-
-    maj_clf = joblib.load(os.path.join(dirname, '../data/models/major.joblib'))
-    min_clf = joblib.load(os.path.join(dirname, '../data/models/minor.joblib'))
-    for i in range(len(chroma)):
-        chroma[i] = np.roll(chroma[i], -utils.note_values[root])
-    prob = maj_clf.predict(chroma) if maj else min_clf.predict(chroma)
-
-    return root + _get_quality(prob[0])
-
-
-def analyze(chroma: np.ndarray, hmm_chords: list, frames: list) -> list:
-    data = []
-    average = np.array([chroma.transpose()[frames[i]:frames[i + 1]].mean(axis=0) for i in range(len(frames) - 1)])
-    for i in range(len(hmm_chords)):
-        if hmm_chords[i] == 'N':
-            data.append('N')
-            continue
-        chord = Chord(hmm_chords[i])
-        data.append(analyze_chords(np.array([average[i]]), str(chord.root), chord.quality in ('M', '7', 'maj7')))
-    return data
+_quality_names = tuple(qualities.keys())
+# Quality of each class of the classifiers in chord codes, -1 for no chord
+_quality_codes = np.array([codes.qualities.index(x) if x != 'N' else -1 for x in _quality_names])
+
+
+# k-NN classifiers telling seventh chords apart within the major and minor families.
+# Models are memory maps, shared by all processes loading them.
+class Classifier(object):
+    families = {True: ('M', '7', 'maj7'), False: ('m', 'm7')}
+
+    def __init__(self, major=os.path.join(dirname, '../data/models/major.npz'),
+                 minor=os.path.join(dirname, '../data/models/minor.npz'), version: Optional[str] = None):
+        self.models = {True: KNN.load(major), False: KNN.load(minor)}
+        # Version of the models in observado.registry
+        self.version: Optional[str] = version
+
+    # Classify segments by their mean chroma, given the HMM chord codes of them, into chord codes.
+    # Only major and minor chords are refined.
+    def predict(self, average: np.ndarray, hmm_chords) -> np.ndarray:
+        return self.classify(average, hmm_chords)[0]
+
+    # Same as predict, also returning the fraction of votes for each chord, NaN for chords not refined.
+    def classify(self, average: np.ndarray, hmm_chords) -> (np.ndarray, np.ndarray):
+        hmm_chords = np.array([codes.encode(x) if isinstance(x, str) else x for x in hmm_chords], dtype=int)
+        data = hmm_chords.copy()
+        confidence = np.full(len(data), np.nan)
+        roots = hmm_chords % 12
+
+        # Transpose every segment to C at once.
+        average = np.asarray(average, dtype=float).reshape(-1, 12)
+        rolled = average[np.arange(len(average))[:, None], (np.arange(12) + roots[:, None]) % 12]
+        for family, quality in ((True, codes.qualities.index('M')), (False, codes.qualities.index('m'))):
+            index = np.flatnonzero(hmm_chords // 12 == quality)
+            if len(index) == 0:
+                continue
+            model = self.models[family]
+            votes = model.predict_proba(rolled[index])
+            refined = _quality_codes[model.classes[np.argmax(votes, axis=1)]]
+            data[index] = np.where(refined < 0, codes.no_chord, 12 * refined + roots[index])
+            confidence[index] = votes.max(axis=1)
+        return data, confidence
+
+
+# Load the classifiers of the current version once and keep them for the lifetime of the process,
+# training them first if the chord tables or the training data changed.
+@lru_cache(maxsize=None)
+def classifier() -> Classifier:
+    from observado import registry
+
+    version, files = registry.models()
+    return Classifier(files[True], files[False], version)
+
+
+# Mean chroma of each segment between frame boundaries, the last boundary excluded.
+# Sums are accumulated "block" frames at a time from the first boundary, so a memory-mapped chromagram is never
+# loaded whole, and segments of a long recording can be taken a few at a time.
+def segment_means(chroma: np.ndarray, frames: list, block=1 << 16) -> np.ndarray:
+    frames = np.asarray(frames, dtype=int)
+    total = np.zeros((len(frames), len(chroma)))
+    running = np.zeros((len(chroma), 1))
+    for start in range(frames[0], frames[-1], block):
+        stop = min(start + block, frames[-1])
+        part = np.cumsum(np.concatenate((running, chroma[:, start:stop]), axis=1), axis=1)
+        inside = (frames > start) & (frames <= stop)
+        total[inside] = part[:, frames[inside] - start].transpose()
+        running = part[:, -1:]
+    return (total[1:] - total[:-1]) / np.maximum(np.diff(frames), 1)[:, np.newaxis]
+
+
+# Chord codes of segments, and with "confidence" the fraction of k-NN votes for each of them too.
+def analyze(chroma: np.ndarray, hmm_chords, frames: list, confidence=False):
+    with profile.stage('analyze.means'):
+        means = segment_means(chroma, frames)
+    with profile.stage('analyze.knn'):
+        result = classifier().classify(means, hmm_chords)
+    return result if confidence else result[0]
 
 
 def main():
-    _train(True)
-    _train(False)
+    print(classifier().version)
 
 
 if __name__ == '__main__':
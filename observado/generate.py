@@ -1,4 +1,8 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import inspect
+import json
 import os
 import random
 import subprocess
@@ -7,15 +11,17 @@ from concurrent import futures
 import librosa
 import numpy as np
 import pandas
+import scipy.io.wavfile
 from tqdm import tqdm
 
-from observado.lib import utils
+from observado.lib import profile, store, synth, utils
 from observado.lib.midi import *
 
 dirname = os.path.dirname(__file__)
 all_notes = utils.all_notes
 all_chords = utils.all_chords
 noise = 0.3
+methods = ('cqt', 'stft', 'cens', 'enhanced_cqt')
 
 
 def multi_run(function, iterator):
@@ -40,7 +46,7 @@ def dir_check():
 
 
 def basic_generate():
-    if os.path.exists(os.path.join(dirname, '../data/features/basic.csv')):
+    if os.path.exists(utils.basic):
         return
 
     data = []
@@ -53,7 +59,7 @@ def basic_generate():
                      'bass': str(p.chord.bass)}
             data.append({**chroma, **extra})
     try:
-        with open(os.path.join(dirname, '../data/features/basic.csv'), 'xt', encoding="utf-8", newline='\n') as f:
+        with open(utils.basic, 'xt', encoding="utf-8", newline='\n') as f:
             print('Generating basic patterns...')
             pandas.DataFrame(data).to_csv(f, index=False, line_terminator='\n')
     except FileExistsError:
@@ -62,24 +68,23 @@ def basic_generate():
         raise e
 
 
+# Write the MIDI files of all chords which are missing or differ from their content.
 def midi_generate():
-    def generate(chord):
-        for i in MIDIChord.inst_table:
-            for j in MIDIChord.play_table.keys():
-                p = MIDIChord(chord, i, j)
-                filename = p.pattern.chord.notation + '_' + str(p.inst) + '_' + str(p.method)
-                p.write(os.path.join(dirname, '../data/midi/{}.mid'.format(filename)))
-
-    dir_list = os.listdir(os.path.join(dirname, '../data/midi'))
-    if (len(dir_list) != 0 and len(dir_list) != 1) or not (len(dir_list) == 1 and dir_list[0] == '.gitkeep'):
-        return
-
-    print('Generating MIDI files...')
-    # Because of the lock when appending to list, multithreading here is useless.
-    # Need to be optimized.
-    multi_run(generate, all_chords)
-
-
+    written = 0
+    for name, content in bulk(all_chords):
+        filename = os.path.join(dirname, '../data/midi/{}.mid'.format(name))
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                if f.read() == content:
+                    continue
+        with open(filename, 'wb') as f:
+            f.write(content)
+        written += 1
+    if written:
+        print('Generated {} MIDI files.'.format(written))
+
+
+# Render the WAV files which are missing or older than their MIDI file.
 def wave_generate():
     def generate(chord):
         for i in MIDIChord.inst_table:
@@ -88,7 +93,7 @@ def wave_generate():
                 filename = p.pattern.chord.notation + '_' + str(p.inst) + '_' + str(p.method)
                 midi_name = os.path.join(dirname, '../data/midi/{}.mid'.format(filename))
                 wave_name = os.path.join(dirname, '../data/waves/{}.wav'.format(filename))
-                if not os.path.exists(wave_name):
+                if not os.path.exists(wave_name) or os.path.getmtime(wave_name) < os.path.getmtime(midi_name):
                     # Problems when running on Windows for 'ø7' chord.
                     if 'ø7' in wave_name:
                         wave_name = wave_name.replace('ø7', 'm7b5')
@@ -107,10 +112,6 @@ def wave_generate():
             print('Make sure timidity is installed.')
             return
 
-    dir_list = os.listdir(os.path.join(dirname, '../data/waves'))
-    if (len(dir_list) != 0 and len(dir_list) != 1) or not (len(dir_list) == 1 and dir_list[0] == '.gitkeep'):
-        return
-
     print('Generating WAV files...')
     # Because of the lock when appending to list, multithreading here is useless.
     # Need to be optimized.
@@ -124,54 +125,112 @@ def wave_generate():
                           os.path.join(dirname, '../data/waves/', file.replace('m7b5', 'ø7')))
 
 
-def wave_feature_generate():
-    storage = {'cqt': [], 'stft': [], 'cens': [], 'enhanced_cqt': []}
+# Functions of observado.lib.utils computing the stored features. Only their code is part of the keys, so that
+# changing anything else there, like adding a quality to the chord tables, keeps the features already made.
+feature_code = ('features', '_enhance', 'nn_filter', 'means')
 
-    paths = [os.path.join(dirname, x) for x in ['../data/features/wav_{}.csv'.format(name) for name in storage.keys()]]
-    existence = [os.path.exists(x) for x in paths]
-    if all(existence):
-        return
 
-    def generate(chord):
+# Hash of the source of modules or functions, so that what they make is out of date once they change.
+def _source(*code) -> str:
+    return hashlib.sha256(''.join(inspect.getsource(x) for x in code).encode('utf-8')).hexdigest()
+
+
+# Parameters of the features of every sound, besides its content and method, with the code of the renderer
+# and of the features.
+def _parameters(timidity=False) -> dict:
+    renderer = 'timidity' if timidity else 'synth ' + _source(synth)
+    return {'renderer': renderer, 'features': _source(*[getattr(utils, x) for x in feature_code]), 'margin': 4,
+            'sr': 22050, 'librosa': librosa.__version__}
+
+
+# Features of every sound of every chord for every method, as dicts of chord, instrument, playing method,
+# feature method and a key hashing the MIDI content of the sound with the parameters of its features,
+# so that an artifact is out of date when anything it is made from changes.
+def artifacts(chords=None, timidity=False) -> list:
+    parameters = json.dumps(_parameters(timidity), sort_keys=True).encode('utf-8')
+    result = []
+    for chord in chords if chords is not None else all_chords:
         for i in MIDIChord.inst_table:
             for j in MIDIChord.play_table.keys():
-                p = MIDIChord(chord, i, j)
-                inst = str(p.inst)
-                play = str(p.method)
-                p = p.pattern
-                filename = p.chord.notation + '_' + inst + '_' + play
-                wave_name = os.path.join(dirname, '../data/waves/{}.wav'.format(filename))
-                notes = [x for x in all_notes if x not in utils.note_alts.keys()]
-                extra = {'notation': p.chord.notation, 'root': str(p.chord.root), 'quality': p.chord.quality,
-                         'bass': str(p.chord.bass)}
-
-                duration = librosa.get_duration(filename=wave_name)
-                # Cut silent part for generated waves files.
-                # Less computation than librosa.effects.trim().
-                y, _ = librosa.load(wave_name, duration=duration - 2)
-                for method in storage.keys():
-                    y = librosa.effects.harmonic(y, margin=4)
-                    chroma = utils.means(utils.chroma(y, method))
-                    chroma = dict(zip(notes, chroma.tolist()))
-                    extra['method'] = method
-                    storage[method].append({**chroma, **extra})
-
-    print('Extracting features from WAV files...')
-    multi_run(generate, all_chords)
+                content = hashlib.sha256(MIDIChord(chord, i, j)._content() + parameters)
+                for method in methods:
+                    key = content.copy()
+                    key.update(method.encode('utf-8'))
+                    result.append({'chord': chord, 'instrument': i, 'play': j, 'method': method,
+                                   'key': key.hexdigest()})
+    return result
 
-    for name in storage.keys():
-        try:
-            with open(os.path.join(dirname, '../data/features/wav_{}.csv'.format(name)), 'xt', encoding="utf-8",
-                      newline='\n') as f:
-                pandas.DataFrame(storage[name]).to_csv(f, index=False, line_terminator='\n')
-        except FileExistsError:
-            pass
-        except Exception as e:
-            raise e
 
+# Keys of the sounds of each method in the feature store in "features", store.directory by default, keeping only
+# those in "keys", so that features out of date are dropped.
+def _compact(keys: set, features=None) -> dict:
+    done = {}
+    for method in methods:
+        _, index = store.load(method, features)
+        stored = np.array([x.hex() for x in index['key']], dtype=object)
+        mask = np.isin(stored, list(keys))
+        store.keep(method, mask, features)
+        done[method] = set(stored[mask])
+    return done
+
+
+# Features of the sounds of a chord for each method, as chroma and index rows of the feature store,
+# given (instrument, playing method, artifacts) to make.
+# Sounds are synthesized in memory, or read from the WAV files rendered by timidity.
+# Synthesized sounds are also written to WAV files if "dump" is set, for debugging.
+def _wave_features(job: tuple, timidity=False, dump=False) -> dict:
+    chord, sounds = job
+    storage = {x: ([], []) for x in methods}
+    for i, j, wanted in sounds:
+        p = MIDIChord(chord, i, j)
+        wave_name = os.path.join(dirname, '../data/waves/{}.wav'.format(p.name()))
+
+        if timidity:
+            with profile.stage('load'):
+                y, sr = librosa.load(wave_name)
+            # Cut silent part for generated waves files.
+            # Less computation than librosa.effects.trim().
+            y = y[:max(len(y) - 2 * sr, 0)]
+        else:
+            with profile.stage('render'):
+                y = synth.render(p)
+            if dump:
+                scipy.io.wavfile.write(wave_name, 22050, y)
+        # Decode and separate once for all methods.
+        with profile.stage('features'):
+            data = utils.features(y, [x['method'] for x in wanted], margin=4)
+        for x in wanted:
+            storage[x['method']][0].append(utils.means(data[x['method']]))
+            storage[x['method']][1].append(store.record(p.pattern.chord.notation, i, j, x['method'], x['key']))
+    return storage
+
+
+# Extract the features of the sounds missing from the feature store or out of date on "workers" processes,
+# appending them to the store in "features" as each chord is done, so that an interrupted run resumes where it stopped.
+def wave_feature_generate(timidity=False, dump=False, workers=None, features=None):
+    wanted = artifacts(all_chords, timidity)
+    done = _compact({x['key'] for x in wanted}, features)
+    todo = [x for x in wanted if x['key'] not in done[x['method']]]
+    if not todo:
+        return
+
+    jobs = {}
+    for x in todo:
+        jobs.setdefault(x['chord'], {}).setdefault((x['instrument'], x['play']), []).append(x)
+    jobs = [(chord, [k + (v,) for k, v in sounds.items()]) for chord, sounds in jobs.items()]
+
+    print('{} {} missing features of {} chords...'.format(
+        'Extracting from WAV files' if timidity else 'Synthesizing chords and extracting', len(todo), len(jobs)))
+    with futures.ProcessPoolExecutor(workers) as pool:
+        work = [pool.submit(_wave_features, x, timidity, dump) for x in jobs]
+        for future in tqdm(futures.as_completed(work), total=len(work)):
+            for method, (chroma, index) in future.result().items():
+                if index:
+                    store.append(method, chroma, index, features)
 
-def noise_feature_generate():
-    if os.path.exists(os.path.join(dirname, '../data/features/noise.csv')):
+
+def noise_feature_generate(features=None):
+    if len(store.load('noise', features)[1]):
         return
 
     random.seed(10)
@@ -186,28 +245,35 @@ def noise_feature_generate():
     while len(data) < len(MIDIChord.inst_table) + len(MIDIChord.play_table):
         r = random.random()
         if r < noise:
-            notes = [x for x in all_notes if x not in utils.note_alts.keys()]
-            chroma = dict(zip(notes, templates[random.randrange(len(templates) - 1)] * r))
-            extra = {'notation': 'N', 'root': 'N', 'quality': 'N', 'bass': 'N'}
-            data.append({**chroma, **extra})
+            data.append(templates[random.randrange(len(templates) - 1)] * r)
 
-    try:
-        with open(os.path.join(dirname, '../data/features/noise.csv'), 'xt', encoding="utf-8", newline='\n') as f:
-            print('Generating non-chord features...')
-            pandas.DataFrame(data).to_csv(f, index=False, line_terminator='\n')
-    except FileExistsError:
-        pass
-    except Exception as e:
-        raise e
+    print('Generating non-chord features...')
+    store.append('noise', data, [store.record('N')] * len(data), features)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Generate the datasets for training.')
+    parser.add_argument('--timidity', action='store_true', help='render MIDI files with timidity instead of in memory')
+    parser.add_argument('--dump', action='store_true', help='write synthesized sounds to data/waves for debugging')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='number of processes extracting features, all cores by default')
+    parser.add_argument('--profile', metavar='TARGET', nargs='?', const='log',
+                        help='time each step, logged or written as a Chrome trace if TARGET ends with .json')
+    args = parser.parse_args()
+
+    profile.configure(args.profile)
     dir_check()
-    basic_generate()
-    midi_generate()
-    wave_generate()
-    wave_feature_generate()
-    noise_feature_generate()
+    with profile.stage('basic_generate'):
+        basic_generate()
+    if args.timidity:
+        with profile.stage('midi_generate'):
+            midi_generate()
+        with profile.stage('wave_generate'):
+            wave_generate()
+    with profile.stage('wave_feature_generate'):
+        wave_feature_generate(args.timidity, args.dump, args.workers)
+    with profile.stage('noise_feature_generate'):
+        noise_feature_generate()
     print('Done.')
 
 
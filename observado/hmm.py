@@ -1,38 +1,343 @@
 #!/usr/bin/env python3
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
 import sys
+import tempfile
+from collections import deque
+from functools import partial
+from typing import Callable, Optional
 
 import librosa
-import librosa.display
-import matplotlib.pyplot as plt
 import numpy as np
 
 import observado.lib.utils as utils
+from observado.lib import chords as codes, profile
 
 
-def _load_data(wav_path) -> np.ndarray:
-    major = utils.chord_table['M']
-    minor = utils.chord_table['m']
-    weights = np.zeros((25, 12), dtype=float)
-    for c in range(12):
-        weights[c, :] = np.roll(major, c)
-        weights[c + 12, :] = np.roll(minor, c)
+# Qualities of utils.full_chord_table recognized by the HMM, by name of vocabulary.
+# Only major and minor chords are refined into seventh chords by the classifiers afterwards.
+vocabularies = {'triads': ('M', 'm'),
+                'sevenths': tuple(utils.chord_table.keys()),
+                'full': tuple(utils.full_chord_table.keys())}
+
+
+# Probability of staying on a chord, and relative probability of changing quality rather than root by vocabulary,
+# 1 for the others. A chord of the same root, like C7 after C, is more likely than any given chord of another root
+# when there are many qualities.
+stay = 0.9
+same_roots = {'full': 2.}
+
+
+def _qualities(qualities=None) -> tuple:
+    if qualities is None:
+        return vocabularies['triads']
+    return vocabularies[qualities] if isinstance(qualities, str) else tuple(qualities)
+
+
+# Templates of the states: every root of each quality in turn, then no chord.
+# Templates sum to 3 like triads, so that chords with more notes are not favoured.
+def _load_data(qualities=None) -> np.ndarray:
+    qualities = _qualities(qualities)
+    weights = np.zeros((12 * len(qualities) + 1, 12), dtype=float)
+    for i, quality in enumerate(qualities):
+        pattern = utils.full_chord_table[quality]
+        for c in range(12):
+            weights[12 * i + c, :] = np.roll(pattern, c) * (3 / pattern.sum())
     weights[-1] = np.array([1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1.]) / 4.
     return weights
 
 
-def analyze_hmm(chroma: np.ndarray, show=False) -> (list, list, list):
-    weights = _load_data(utils.enhanced_cqt)
-    labels = [(lambda x, y: x + y if y != 'M' else x)(x, y) for y in ['M', 'm'] for x in utils.all_notes if
+def _load_labels(qualities=None) -> list:
+    labels = [(lambda x, y: x + y if y != 'M' else x)(x, y) for y in _qualities(qualities) for x in utils.all_notes if
               x not in utils.note_alts.keys()]
     labels.append('N')
-    trans = librosa.sequence.transition_loop(25, 0.9)
+    return labels
+
+
+# Chord code of each state, as in observado.lib.chords.
+def _load_codes(qualities=None) -> np.ndarray:
+    return np.array([12 * codes.qualities.index(y) + x for y in _qualities(qualities) for x in range(12)]
+                    + [codes.no_chord])
+
+
+# Root of each state, with 12 for no chord.
+def _load_groups(qualities=None) -> np.ndarray:
+    return np.append(np.tile(np.arange(12), len(_qualities(qualities))), 12)
+
+
+# Weight of chords of the same root in the transitions of a vocabulary, that of same_roots unless given.
+def _same_root(qualities=None, quality: Optional[float] = None) -> float:
+    if quality is not None:
+        return quality
+    return same_roots.get(qualities, 1.) if isinstance(qualities, str) else 1.
+
+
+# Transitions staying with probability p, and otherwise moving to any other chord, chords of the same root
+# being "quality" times as likely as the others, by default the weight of the vocabulary in same_roots.
+# With a quality of 1 it is librosa.sequence.transition_loop.
+def _load_transitions(qualities=None, p=stay, quality: Optional[float] = None) -> np.ndarray:
+    groups = _load_groups(qualities)
+    quality = _same_root(qualities, quality)
+    if quality == 1.:
+        return librosa.sequence.transition_loop(len(groups), p)
+    same = (groups[:, np.newaxis] == groups[np.newaxis, :]) & (groups[:, np.newaxis] != 12)
+    trans = np.where(same, quality, 1.)
+    np.fill_diagonal(trans, 0)
+    trans *= (1 - p) / trans.sum(axis=1, keepdims=True)
+    np.fill_diagonal(trans, p)
+    return trans
+
+
+# Probabilities of staying and of moving to each other state, if the transition matrix
+# is in the form of librosa.sequence.transition_loop, otherwise None.
+def _loop_structure(trans: np.ndarray) -> Optional[tuple]:
+    if len(trans) < 2:
+        return None
+    stay = np.diag(trans)
+    move = trans[~np.eye(len(trans), dtype=bool)]
+    if np.all(stay == stay[0]) and np.all(move == move[0]):
+        return stay[0], move[0]
+    return None
+
+
+# Probabilities of each state staying, moving to each other state of its group, and moving to each state
+# of another group, as arrays of shape (K,), if every row of the transition matrix only has these three values,
+# otherwise None.
+def _group_structure(trans: np.ndarray, groups: np.ndarray) -> Optional[tuple]:
+    same = groups[:, np.newaxis] == groups[np.newaxis, :]
+    eye = np.eye(len(trans), dtype=bool)
+    values = []
+    for mask in (eye, same & ~eye, ~same):
+        x = np.where(mask, trans, np.nan)
+        low, high = np.nanmin(x, axis=1, initial=np.inf), np.nanmax(x, axis=1, initial=-np.inf)
+        if np.any(low[mask.any(axis=1)] != high[mask.any(axis=1)]):
+            return None
+        values.append(np.where(mask.any(axis=1), low, 0.))
+    return tuple(values)
+
+
+# One step of Viterbi decoding when every state either stays or moves to any other state uniformly.
+# Only the best previous state and the state itself are candidates, so it costs O(K) instead of O(K²).
+# Values are of shape (B, K). Ties are broken towards the lower state like librosa does.
+def _loop_step(value: np.ndarray, log_stay: float, log_move: float) -> (np.ndarray, np.ndarray):
+    states = np.arange(value.shape[-1])
+    top = np.argmax(value, axis=-1)[:, np.newaxis]
+    best = np.max(value, axis=-1, keepdims=True)
+    stay = value + log_stay
+    if log_stay > log_move:
+        # The best state always stays, so the best other state of the rest is the best state.
+        move = best + log_move
+        keep = (stay > move) | ((stay == move) & (states < top))
+        return np.where(keep, stay, move), np.where(keep, states, top)
+    second = np.argmax(np.where(states == top, -np.inf, value), axis=-1)[:, np.newaxis]
+    other = np.where(states == top, second, top)
+    move = np.take_along_axis(value, other, axis=-1) + log_move
+    keep = (stay > move) | ((stay == move) & (states < other))
+    return np.where(keep, stay, move), np.where(keep, states, other)
+
+
+# Best and second best states of each group of a padded (G, M) matrix of states, with their values.
+def _group_top(value: np.ndarray, members: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    padded = np.concatenate((value, np.full((len(value), 1), -np.inf)), axis=1)[:, members]
+    first = np.argmax(padded, axis=-1)
+    first_value = np.take_along_axis(padded, first[..., np.newaxis], axis=-1)[..., 0]
+    np.put_along_axis(padded, first[..., np.newaxis], -np.inf, axis=-1)
+    second = np.argmax(padded, axis=-1)
+    second_value = np.take_along_axis(padded, second[..., np.newaxis], axis=-1)[..., 0]
+    index = np.arange(len(members))
+    return members[index, first], first_value, members[index, second], second_value
+
+
+# One step of Viterbi decoding when states stay, move within their group, or move to another group,
+# each with its own probability for each state, like chords changing quality or root. Groups are given as
+# a padded (G, M) matrix of the states of each group in increasing order, padded with K, and the group of each state.
+# Costs O(K) like _loop_step, with the same ties.
+def _group_step(value: np.ndarray, members: np.ndarray, groups: np.ndarray, log_stay: np.ndarray,
+                log_same: np.ndarray, log_other: np.ndarray) -> (np.ndarray, np.ndarray):
+    n_states = value.shape[1]
+    states = np.arange(n_states)
+
+    # Best other state of the same group
+    first, first_value, second, second_value = _group_top(value + log_same, members)
+    mine = first[:, groups] == states
+    same = np.where(mine, second[:, groups], first[:, groups])
+    same_value = np.where(mine, second_value[:, groups], first_value[:, groups])
+
+    # Best state of the other groups, the lower state of equal ones.
+    first, first_value, _, _ = _group_top(value + log_other, members)
+    top = np.argmin(np.where(first_value == first_value.max(axis=1, keepdims=True), first, n_states + 1), axis=1)
+    rest = np.where(np.arange(len(members)) == top[:, np.newaxis], -np.inf, first_value)
+    runner = np.argmin(np.where(rest == rest.max(axis=1, keepdims=True), first, n_states + 1), axis=1)
+    other_group = np.where(groups == top[:, np.newaxis], runner[:, np.newaxis], top[:, np.newaxis])
+    other = np.take_along_axis(first, other_group, axis=1)
+    other_value = np.take_along_axis(first_value, other_group, axis=1)
+
+    best, ptr = value + log_stay, np.broadcast_to(states, value.shape)
+    for candidate, state in ((same_value, same), (other_value, other)):
+        take = (candidate > best) | ((candidate == best) & (state < ptr))
+        best, ptr = np.where(take, candidate, best), np.where(take, state, ptr)
+    return best, ptr
 
-    probs = np.exp(weights.dot(chroma))
-    probs /= probs.sum(axis=0, keepdims=True)
-    chords_ind = np.argmax(probs, axis=0)
-    chords_vit = librosa.sequence.viterbi_discriminative(probs, trans)
+
+# One step of Viterbi decoding with any transition matrix, in O(K²).
+def _dense_step(value: np.ndarray, log_trans: np.ndarray) -> (np.ndarray, np.ndarray):
+    trans_out = value[:, :, np.newaxis] + log_trans
+    ptr = np.argmax(trans_out, axis=1)
+    return np.take_along_axis(trans_out, ptr[:, np.newaxis], axis=1)[:, 0], ptr
+
+
+# Decoding step in O(K) for a transition matrix of the structure of _loop_structure, or of _group_structure
+# with the groups of the states, otherwise None.
+def _structured_step(trans: np.ndarray, groups: Optional[np.ndarray] = None) -> Optional[Callable]:
+    tiny = np.finfo(float).tiny
+    structure = _loop_structure(trans)
+    if structure is not None:
+        log_stay, log_move = np.log(np.array(structure) + tiny)
+        return partial(_loop_step, log_stay=log_stay, log_move=log_move)
+    structure = None if groups is None else _group_structure(trans, groups)
+    if structure is None:
+        return None
+    members = [np.flatnonzero(groups == x) for x in np.unique(groups)]
+    padded = np.full((len(members), max(len(x) for x in members)), len(trans))
+    for i, x in enumerate(members):
+        padded[i, :len(x)] = x
+    log_stay, log_same, log_other = np.log(np.array(structure) + tiny)
+    return partial(_group_step, members=padded, groups=np.searchsorted(np.unique(groups), groups),
+                   log_stay=log_stay, log_same=log_same, log_other=log_other)
+
+
+# Viterbi decoding of state probabilities of shape (..., K, T), with the transition model
+# of librosa.sequence.transition_loop(K, p). Leading dimensions are decoded together as a batch.
+def viterbi_loop(probs: np.ndarray, p=0.9) -> np.ndarray:
+    tiny = np.finfo(float).tiny
+    return _viterbi_steps(probs, partial(_loop_step, log_stay=np.log(p + tiny),
+                                         log_move=np.log((1 - p) / (probs.shape[-2] - 1) + tiny)))
+
+
+# Viterbi decoding of state probabilities of shape (..., K, T) in batch, with a step function
+# taking the values of shape (B, K) and returning the best values and back pointers of the next frame.
+def _viterbi_steps(probs: np.ndarray, step: Callable) -> np.ndarray:
+    shape = probs.shape
+    n_states, n_steps = shape[-2:]
+    log_prob = np.log(np.moveaxis(probs.reshape(-1, n_states, n_steps), -1, 0) + np.finfo(float).tiny)
+    n_batch = log_prob.shape[1]
+
+    ptr = np.zeros(log_prob.shape, dtype=np.min_scalar_type(n_states))
+    value = log_prob[0]
+    for t in range(1, n_steps):
+        best, ptr[t] = step(value)
+        value = best + log_prob[t]
+
+    states = np.zeros((n_steps, n_batch), dtype=int)
+    states[-1] = np.argmax(value, axis=-1)
+    batch = np.arange(n_batch)
+    for t in range(n_steps - 1, 0, -1):
+        states[t - 1] = ptr[t, batch, states[t]]
+    return states.transpose().reshape(shape[:-2] + (n_steps,))
+
+
+# Viterbi decoding with a transition matrix of shape (K, K), using the O(T·K) decoder when the matrix allows it,
+# given the groups of the states for structures of _group_structure.
+# The dense decoder of librosa is compiled, so it stays faster for a single input until K is about 90,
+# or about 250 for the grouped structure.
+def viterbi(probs: np.ndarray, trans: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    step = _structured_step(trans, groups)
+    if step is not None and (probs.ndim > 2 or len(trans) >= (96 if step.func is _loop_step else 256)):
+        return _viterbi_steps(probs, step)
+    if probs.ndim > 2:
+        return np.array([viterbi(x, trans) for x in probs.reshape((-1,) + probs.shape[-2:])]).reshape(
+            probs.shape[:-2] + probs.shape[-1:])
+    return librosa.sequence.viterbi_discriminative(probs, trans)
+
+
+# Posterior probabilities of the states of each frame given all frames, of shape (K, T), by the forward-backward
+# algorithm with scaling, for state probabilities of shape (K, T) taken as likelihoods like viterbi does.
+def posteriors(probs: np.ndarray, trans: np.ndarray) -> np.ndarray:
+    n_states, n_steps = probs.shape
+    alpha = np.zeros((n_steps, n_states))
+    scale = np.zeros(n_steps)
+    forward = probs[:, 0] / n_states
+    for t in range(n_steps):
+        if t:
+            forward = alpha[t - 1].dot(trans) * probs[:, t]
+        scale[t] = forward.sum()
+        alpha[t] = forward / scale[t]
+    beta = np.ones(n_states)
+    for t in range(n_steps - 1, -1, -1):
+        alpha[t] *= beta
+        alpha[t] /= alpha[t].sum()
+        beta = trans.dot(probs[:, t] * beta) / scale[t]
+    return alpha.transpose()
+
+
+# Online Viterbi decoding, deciding the state of each frame once a fixed number of later frames are seen.
+class FixedLagViterbi(object):
+    def __init__(self, trans: np.ndarray, lag: int, groups: Optional[np.ndarray] = None):
+        self.step = _structured_step(trans, groups) or partial(_dense_step,
+                                                               log_trans=np.log(trans + np.finfo(float).tiny))
+        self.lag = lag
+        self.value = None
+        # Back pointers of the undecided frames except the first one.
+        self.ptr = deque()
+
+    # Push the state probabilities of the next frame, returning the states decided by it.
+    def push(self, prob: np.ndarray) -> list:
+        log_prob = np.log(prob + np.finfo(float).tiny)
+        if self.value is None:
+            self.value = log_prob
+            return []
+        best, ptr = self.step(self.value[np.newaxis])
+        self.value = log_prob + best[0]
+        ptr = ptr[0]
+        self.ptr.append(ptr)
+        if len(self.ptr) < self.lag:
+            return []
+        state = self._backtrack()[0]
+        self.ptr.popleft()
+        return [state]
+
+    # Decide all remaining frames.
+    def flush(self) -> list:
+        if self.value is None:
+            return []
+        states = self._backtrack()
+        self.value = None
+        self.ptr.clear()
+        return states
+
+    def _backtrack(self) -> list:
+        states = [int(np.argmax(self.value))]
+        for ptr in reversed(self.ptr):
+            states.append(int(ptr[states[-1]]))
+        return states[::-1]
+
+
+# Decode chords from a chromagram, returning the chord code of each segment, and the times and frames of their
+# boundaries.
+# Columns standing for several frames, like means between beats, weigh as much as that many frames with "durations".
+# Chords are those of a vocabulary of the HMM, by name or as a tuple of qualities.
+# With "posterior", the mean posterior probability of the chord of each segment over its frames is also returned.
+# "same_root" weighs changes of quality against changes of root as in _load_transitions.
+# "decoder" replaces viterbi, with the same arguments.
+def analyze_hmm(chroma: np.ndarray, show=False, durations: Optional[np.ndarray] = None,
+                qualities=None, posterior=False, decoder: Optional[Callable] = None,
+                same_root: Optional[float] = None) -> tuple:
+    weights = _load_data(qualities)
+    labels = _load_labels(qualities)
+    states = _load_codes(qualities)
+    groups = _load_groups(qualities)
+    trans = _load_transitions(qualities, quality=same_root)
+
+    with profile.stage('hmm.probabilities'):
+        log_probs = weights.dot(chroma)
+        if durations is not None:
+            log_probs = log_probs * durations
+        probs = np.exp(log_probs - log_probs.max(axis=0, keepdims=True))
+        probs /= probs.sum(axis=0, keepdims=True)
+        chords_ind = np.argmax(probs, axis=0)
+    with profile.stage('hmm.viterbi'):
+        chords_vit = (decoder or viterbi)(probs, trans, groups)
 
     if show:
         show_hmm(chroma, weights, labels, probs, chords_vit, chords_ind)
@@ -40,18 +345,71 @@ def analyze_hmm(chroma: np.ndarray, show=False) -> (list, list, list):
     frames = [x + 1 for x in range(len(chords_vit) - 1) if chords_vit[x] != chords_vit[x + 1]]
     frames.insert(0, 0)
     frames.append(len(chords_vit) - 1)
-    chords = [labels[chords_vit[x]] for x in frames[:-1]]
+    result = states[chords_vit[frames[:-1]]], librosa.frames_to_time(frames), frames
+    if not posterior:
+        return result
+    weight = np.ones(len(chords_vit)) if durations is None else np.asarray(durations, dtype=float)
+    with profile.stage('hmm.posteriors'):
+        chosen = posteriors(probs, trans)[chords_vit, np.arange(len(chords_vit))] * weight
+    return result + (np.add.reduceat(chosen, frames[:-1]) / np.add.reduceat(weight, frames[:-1]),)
+
+
+# Same as analyze_hmm, for chromagrams too long for memory such as memory maps.
+# Probabilities are computed "block" frames at a time, and back pointers are kept in a temporary file in "directory".
+def analyze_hmm_blocked(chroma: np.ndarray, block=1 << 14, directory=None, qualities=None,
+                        same_root: Optional[float] = None) -> (list, list, list):
+    weights = _load_data(qualities)
+    states = _load_codes(qualities)
+    step = _structured_step(_load_transitions(qualities, quality=same_root), _load_groups(qualities))
+    tiny = np.finfo(float).tiny
+    n_steps = chroma.shape[1]
+    dtype = np.min_scalar_type(len(states))
+
+    with tempfile.TemporaryDirectory(dir=directory) as path:
+        ptr = np.memmap(os.path.join(path, 'ptr'), dtype=dtype, mode='w+', shape=(max(n_steps, 1), len(states)))
+        value = None
+        for start in range(0, n_steps, block):
+            probs = np.exp(weights.dot(chroma[:, start:start + block]))
+            probs /= probs.sum(axis=0, keepdims=True)
+            log_prob = np.log(probs.transpose() + tiny)
+            part = np.zeros(log_prob.shape, dtype=dtype)
+            for t in range(len(log_prob)):
+                if value is None:
+                    value = log_prob[t][np.newaxis]
+                    continue
+                best, part[t] = step(value)
+                value = best + log_prob[t]
+            ptr[start:start + len(part)] = part
+
+        # Back pointers are read back one block at a time, keeping only the frames where the chord changes.
+        state = int(np.argmax(value))
+        changes = []
+        for start in range((n_steps - 1) // block * block, -1, -block):
+            part = np.array(ptr[start:start + block])
+            for t in range(len(part) - 1, 0 if start == 0 else -1, -1):
+                previous = int(part[t, state])
+                if previous != state:
+                    changes.append((start + t, state))
+                state = previous
+        del ptr
+
+    frames = [0] + [x for x, _ in reversed(changes)] + [n_steps - 1]
+    chords = states[[state] + [x for _, x in reversed(changes)]]
     return chords, librosa.frames_to_time(frames), frames
 
 
 def show_hmm(chroma, weights, labels, probs, chords_vit, chords_ind):
+    # Plotting only, kept out of the imports of analysis.
+    import librosa.display
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 12))
     plt.subplot(2, 1, 1)
     librosa.display.specshow(chroma, x_axis='time', y_axis='chroma')
     plt.colorbar()
     plt.subplot(2, 1, 2)
     librosa.display.specshow(weights, x_axis='chroma')
-    plt.yticks(np.arange(25) + 0.5, labels)
+    plt.yticks(np.arange(len(labels)) + 0.5, labels)
     plt.ylabel('Chord')
     plt.colorbar()
     plt.tight_layout()
@@ -72,8 +430,7 @@ def show_hmm(chroma, weights, labels, probs, chords_vit, chords_ind):
 
 def main():
     y, _ = librosa.load(sys.argv[1] if len(sys.argv) > 1 else librosa.util.example_audio_file())
-    y = librosa.effects.harmonic(y, margin=4)
-    chroma = utils.chroma(y, 'cens')
+    chroma = utils.features(y, ('cens',), margin=4)['cens']
     analyze_hmm(chroma, True)
 
 
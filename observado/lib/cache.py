@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+dirname = os.path.dirname(__file__)
+# An empty directory disables the cache.
+directory = os.environ.get('OBSERVADO_CACHE', os.path.join(dirname, '../../data/cache'))
+max_bytes = int(os.environ.get('OBSERVADO_CACHE_SIZE', 1 << 30))
+
+
+# Hash of the content of a file.
+def digest(filename: str, chunk=1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Features stored as .npy files keyed by file content and feature parameters,
+# evicting the least recently used ones beyond a size limit.
+class FeatureCache(object):
+    def __init__(self, path=directory, size=max_bytes):
+        self.path: str = path
+        self.size: int = size
+
+    def key(self, filename: str, **params) -> str:
+        params = json.dumps(params, sort_keys=True)
+        return hashlib.sha256((digest(filename) + params).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        filename = os.path.join(self.path, key + '.npy')
+        try:
+            array = np.load(filename, mmap_mode='r')
+            # Mark as recently used.
+            os.utime(filename)
+            return array
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key: str, array: np.ndarray) -> np.ndarray:
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, key + '.npy')
+        temp = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        with open(temp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+        # Readers never see a partly written file.
+        os.replace(temp, filename)
+        self.evict()
+        try:
+            return np.load(filename, mmap_mode='r')
+        except FileNotFoundError:
+            # Larger than the whole cache.
+            return array
+
+    # Compute features of a file, or load them from the cache.
+    def fetch(self, filename: str, compute: Callable[[], np.ndarray], **params) -> np.ndarray:
+        if not self.path:
+            return compute()
+        key = self.key(filename, **params)
+        array = self.get(key)
+        return array if array is not None else self.put(key, compute())
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+                except FileNotFoundError:
+                    pass
+        total = sum(x[1] for x in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                continue
+            total -= size
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 import numpy as np
 
@@ -9,6 +10,9 @@ class Note(object):
     value_table = utils.note_values
     alt_table = utils.note_alts
     notes = utils.all_notes
+    __slots__ = ('_note', '_value')
+    # Notes are immutable and shared by name.
+    _interned = {}
 
     # Capitalize musical notes name.
     @staticmethod
@@ -20,13 +24,20 @@ class Note(object):
         except ValueError as e:
             raise e
 
-    def __init__(self, name: str):
-        try:
-            if not self._check(name):
+    def __new__(cls, name: str):
+        self = cls._interned.get(name)
+        if self is None:
+            if not cls._check(name):
                 raise ValueError
-            self._note: str = self.upper(name)
-        except ValueError as e:
-            raise e
+            self = object.__new__(cls)
+            self._note: str = cls.upper(name)
+            note = cls.alt_table.get(self._note, self._note)
+            self._value: int = cls.value_table[note]
+            cls._interned[name] = self
+        return self
+
+    def __reduce__(self):
+        return Note, (self._note,)
 
     def __hash__(self):
         return hash(str(self))
@@ -38,38 +49,46 @@ class Note(object):
         return '{}'.format(self._note)
 
     def __eq__(self, other):
-        try:
-            other = str(other)
-            pattern = r'Note\((\w+)\)'
-            ivt_table = {v: k for k, v in self.alt_table.items()}
-            if re.match(pattern, other):
-                other = [x for x in re.split(pattern, other) if x][0]
-            other = self.upper(other)
-            return True if self._note == other or \
-                           (self._note in self.alt_table and self.alt_table[self._note] == other) \
-                           or (self._note in ivt_table and ivt_table[self._note] == other) else False
-        except ValueError:
-            return False
+        if isinstance(other, Note):
+            return self._value == other._value
+        return self._value == _note_value(str(other))
 
     # Check if note name is legal.
-    def _check(self, name: str) -> bool:
-        return True if self.upper(name) in self.notes else False
+    @classmethod
+    def _check(cls, name: str) -> bool:
+        return True if cls.upper(name) in cls.notes else False
 
     # Get position by note.
     def value(self) -> int:
-        note = self.alt_table[self._note] if self._note in self.alt_table else self._note
-        return self.value_table[note]
+        return self._value
+
+
+# Value of a note given by name or as "Note(name)", or None if it is not a note.
+@lru_cache(maxsize=1024)
+def _note_value(name: str):
+    match = re.fullmatch(r'Note\((\w+)\)', name)
+    try:
+        return Note(match.group(1) if match else name).value()
+    except (ValueError, IndexError):
+        return None
 
 
 class Chord(object):
     pattern = r'([A-G|a-g][#|b]?)((add6|7|maj7)?sus(2|4)?|((m|aug)?add6)|m?maj7|[m|ø]7?|9|11|13|' \
               r'((aug|dim)?(7|maj7|add9)?)?)/?([A-G|a-g][#|b]?)?'
-
-    def __init__(self, notation: str):
+    __slots__ = ('root', 'quality', 'notation', 'bass')
+    # Chords are immutable and parsed once by notation.
+    _interned = {}
+
+    def __new__(cls, notation: str):
+        self = cls._interned.get(notation)
+        if self is not None:
+            return self
         try:
-            if not re.fullmatch(self.pattern, notation):
+            if not re.fullmatch(cls.pattern, notation):
                 raise ValueError
-            groups = [x for x in re.split(self.pattern, notation) if x]
+            groups = [x for x in re.split(cls.pattern, notation) if x]
+            self = object.__new__(cls)
             self.root: Note = Note(groups[0])
             self.quality: str = groups[1] if len(groups) != 1 else 'M'
             self.notation: str = str(self.root) + (self.quality if self.quality != 'M' else '')
@@ -80,9 +99,18 @@ class Chord(object):
                 self.notation += '/' + str(self.bass)
         except ValueError as e:
             raise e
+        cls._interned[notation] = self
+        return self
+
+    def __reduce__(self):
+        return Chord, (self.notation,)
+
+    # Attributes in the order they are set, as __dict__ was before slots.
+    def _fields(self) -> dict:
+        return {x: getattr(self, x) for x in self.__slots__}
 
     def __repr__(self):
-        return 'Chord({!r})'.format(self.__dict__)
+        return 'Chord({!r})'.format(self._fields())
 
     def __str__(self):
         return '{}'.format(self.notation)
@@ -90,21 +118,69 @@ class Chord(object):
 
 class Pattern(object):
     table = utils.chord_table
+    __slots__ = ('array', 'chord', 'available')
+    # Patterns are immutable and shared by class and chord.
+    _interned = {}
 
-    def __init__(self, chord):
+    def __new__(cls, chord):
         try:
-            self.array: np.ndarray = np.array([])
-            self.chord: Chord = chord if isinstance(chord, Chord) else Chord(chord)
-            self.available: bool = False
-            if self.chord.quality in self.table and self.chord.root == self.chord.bass:
-                self.available = True
-                # Transpose by notes.
-                self.array = np.roll(self.table[self.chord.quality], self.chord.root.value())
+            chord = chord if isinstance(chord, Chord) else Chord(chord)
         except ValueError as e:
             raise e
+        self = Pattern._interned.get((cls, chord.notation))
+        if self is None:
+            self = object.__new__(cls)
+            self._setup(chord)
+            Pattern._interned[(cls, chord.notation)] = self
+        return self
+
+    def __reduce__(self):
+        return type(self), (self.chord,)
+
+    # Compute the attributes of a new pattern, once per class and chord.
+    def _setup(self, chord: Chord):
+        self.array: np.ndarray = np.array([])
+        self.chord: Chord = chord
+        self.available: bool = False
+        if self.chord.quality in self.table and self.chord.root == self.chord.bass:
+            self.available = True
+            # Transpose by notes.
+            self.array = np.roll(self.table[self.chord.quality], self.chord.root.value())
+        # Shared by every user of the pattern.
+        self.array.flags.writeable = False
+
+    # Attributes of the class and its bases in the order they are set, as __dict__ was before slots.
+    def _fields(self) -> dict:
+        return {x: getattr(self, x) for c in reversed(type(self).__mro__) for x in c.__dict__.get('__slots__', ())}
 
     def __repr__(self):
-        return 'Pattern({!r})'.format(self.__dict__)
+        return 'Pattern({!r})'.format(self._fields())
 
     def __str__(self):
         return 'Pattern({}, {})'.format(str(self.chord), str(self.array))
+
+
+# Chords are coded as integers, 12 × quality + root, with the qualities in the order of utils.full_chord_table,
+# and no chord after all of them. Codes are the states of the HMM with the full vocabulary.
+qualities = tuple(utils.full_chord_table.keys())
+no_chord = 12 * len(qualities)
+_roots = [x for x in utils.all_notes if x not in utils.note_alts.keys()]
+labels = tuple([x + (y if y != 'M' else '') for y in qualities for x in _roots] + ['N'])
+
+
+# Code of a chord notation of a quality of the tables, without bass.
+@lru_cache(maxsize=None)
+def encode(notation: str) -> int:
+    if notation == 'N':
+        return no_chord
+    chord = Chord(notation)
+    if chord.quality not in qualities or chord.bass != chord.root:
+        raise ValueError
+    return 12 * qualities.index(chord.quality) + chord.root.value()
+
+
+# Notation of a code, or of each of an array of codes.
+def decode(code):
+    if np.ndim(code):
+        return [labels[x] for x in np.asarray(code).ravel()]
+    return labels[code]
@@ -0,0 +1,115 @@
+import struct
+import zipfile
+
+import numpy as np
+
+
+# Load the arrays of an uncompressed .npz file as memory maps, or into memory if not possible.
+def _load_npz(filename: str, mmap=True) -> dict:
+    arrays = {}
+    with zipfile.ZipFile(filename) as z, open(filename, 'rb') as f:
+        for info in z.infolist():
+            name = info.filename[:-len('.npy')]
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with z.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            # Skip the local file header to the .npy data.
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or 0 in shape or not shape:
+                with z.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+# Votes for each class as fractions of the weights of neighbours, given their distances and labels as indexes
+# of classes, nearest first. Neighbours weigh the same, or the inverse of their distance with "distance" weights.
+def votes(distance: np.ndarray, labels: np.ndarray, n_classes: int, weights='uniform') -> np.ndarray:
+    if weights == 'distance':
+        with np.errstate(divide='ignore'):
+            weight = 1. / distance
+        # Exact matches take all the weight.
+        exact = np.isinf(weight).any(axis=1)
+        weight[exact] = np.isinf(weight[exact])
+    else:
+        weight = np.ones(distance.shape)
+    result = np.zeros((len(labels), n_classes))
+    np.add.at(result, (np.arange(len(labels))[:, np.newaxis], labels), weight)
+    return result / result.sum(axis=1, keepdims=True)
+
+
+# k-nearest neighbours classifier with Euclidean distance, predicting like
+# sklearn.neighbors.KNeighborsClassifier but only needing NumPy.
+class KNN(object):
+    def __init__(self, x: np.ndarray, y: np.ndarray, classes: np.ndarray, k=5, weights='uniform'):
+        # Training vectors, and their labels as indexes of classes
+        self.x: np.ndarray = x
+        self.y: np.ndarray = y
+        self.classes: np.ndarray = classes
+        self.k: int = int(k)
+        self.weights: str = weights
+
+    def __repr__(self):
+        return 'KNN(k={}, weights={!r}, size={})'.format(self.k, self.weights, len(self.x))
+
+    @classmethod
+    def fit(cls, x: np.ndarray, labels: np.ndarray, k=5, weights='uniform'):
+        classes, y = np.unique(labels, return_inverse=True)
+        return cls(np.asarray(x, dtype=float), y, classes, k, weights)
+
+    # Convert a fitted sklearn.neighbors.KNeighborsClassifier.
+    @classmethod
+    def from_sklearn(cls, clf):
+        if clf.effective_metric_ != 'euclidean' or not isinstance(clf.weights, str):
+            raise ValueError
+        return cls(np.asarray(clf._fit_X, dtype=float), np.asarray(clf._y), np.asarray(clf.classes_),
+                   clf.n_neighbors, clf.weights)
+
+    @classmethod
+    def load(cls, filename: str, mmap=True):
+        data = _load_npz(filename, mmap)
+        return cls(data['x'], data['y'], data['classes'], int(data['k']), 'distance' if data['distance'] else 'uniform')
+
+    def save(self, filename: str):
+        np.savez(filename, x=self.x, y=self.y, classes=self.classes, k=self.k,
+                 distance=self.weights == 'distance')
+
+    # Distances and indexes of the nearest training vectors of each row, nearest first. Distances are computed
+    # "chunk" rows at a time from squared norms and dot products, so memory does not grow with the number of rows.
+    def kneighbors(self, x: np.ndarray, chunk=256) -> (np.ndarray, np.ndarray):
+        x = np.asarray(x, dtype=float).reshape(-1, self.x.shape[1])
+        squares = (self.x * self.x).sum(axis=1)
+        k = min(self.k, len(self.x))
+        distances, indexes = [], []
+        for start in range(0, len(x), chunk):
+            part = x[start:start + chunk]
+            # Rounding can make squared distances slightly negative.
+            distance = np.sqrt(np.maximum((part * part).sum(axis=1)[:, np.newaxis] - 2 * part.dot(self.x.T) + squares,
+                                          0))
+            index = np.argpartition(distance, k - 1, axis=1)[:, :k] if k < len(self.x) else \
+                np.tile(np.arange(len(self.x)), (len(part), 1))
+            distance = np.take_along_axis(distance, index, axis=1)
+            order = np.argsort(distance, axis=1, kind='stable')
+            distances.append(np.take_along_axis(distance, order, axis=1))
+            indexes.append(np.take_along_axis(index, order, axis=1))
+        if not distances:
+            return np.zeros((0, k)), np.zeros((0, k), dtype=int)
+        return np.concatenate(distances), np.concatenate(indexes)
+
+    # Votes for each class, as fractions of the weights of the neighbours.
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        distance, index = self.kneighbors(x)
+        return votes(distance, self.y[index], len(self.classes), self.weights)
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return self.classes[np.argmax(self.predict_proba(x), axis=1)]
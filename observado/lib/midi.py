@@ -1,3 +1,7 @@
+import zipfile
+from typing import Iterator
+
+from observado.lib import utils
 from observado.lib.chords import Chord, Pattern
 
 
@@ -6,13 +10,14 @@ class MIDI(Pattern):
     # MIDI note numbers of C3 to B3, C4 to B4
     bass = [x for x in range(48, 59 + 1)]
     alto = [x for x in range(60, 71 + 1)]
+    __slots__ = ('component',)
 
-    def __init__(self, chord):
-        super().__init__(chord)
+    def _setup(self, chord: Chord):
+        super()._setup(chord)
         self.component: list = self._calc()
 
     def __repr__(self):
-        return 'MIDIPattern({!r})'.format(self.__dict__)
+        return 'MIDIPattern({!r})'.format(self._fields())
 
     def __str__(self):
         return 'MIDIPattern({}, {})'.format(str(self.chord), str(self.component))
@@ -24,61 +29,59 @@ class MIDI(Pattern):
         return sorted(bass + alto)
 
 
+# Variable-length quantity, as delta times are written in MIDI files.
+def _vlq(n: int) -> bytes:
+    data = bytearray([n & 0x7f])
+    n >>= 7
+    while n:
+        data.insert(0, 0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(data)
+
+
 # For generating chord sounds for several seconds with different instruments.
 class MIDIChord(object):
     # MIDI header, <'Mthd'><length><format><number of tracks><division>
-    _MThd: str = '4d 54 68 64 00 00 00 06 00 01 00 01 00 80'
+    _MThd: bytes = bytes.fromhex('4d 54 68 64 00 00 00 06 00 01 00 01 00 80')
     # MIDI track type
-    _MTrk_type: str = '4d 54 72 6b'
+    _MTrk_type: bytes = bytes.fromhex('4d 54 72 6b')
     # MIDI instruments
     inst_table = [0, 1, 2, 10, 12, 24, 25, 26, 27, 40, 41, 42, 48, 49, 54, 55, 56, 57, 80, 81, 88, 89, 90]
 
-    def _play_0(self) -> str:
-        # Press keys
-        event = ''.join(x for x in ['90' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-        event = event[:event.rfind('00')] + '8400'
-        # Release keys
-        event += ''.join(x for x in ['80' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-        return event
-
-    def _play_1(self) -> str:
-        # Press keys
-        event = ''.join(x for x in ['90' + '{:02x}'.format(x) + '408200' for x in self.pattern.component])
-        # Release keys
-        event += ''.join(x for x in ['80' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-        return event
+    # Playing patterns give (tick, status, note) events in order, "beat" ticks being a quarter note.
+    def _play_0(self) -> list:
+        notes = self.pattern.component
+        # Press keys, then release them
+        return [(0, 0x90, x) for x in notes] + [(4 * self.beat, 0x80, x) for x in notes]
 
-    def _play_2(self) -> str:
-        # Press keys
-        event = ''.join(x for x in ['90' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-        event = event[:event.rfind('00')] + '8200'
+    def _play_1(self) -> list:
+        notes = self.pattern.component
+        # Press keys one by one
+        event = [(2 * self.beat * i, 0x90, x) for i, x in enumerate(notes)]
         # Release keys
-        event += ''.join(x for x in ['80' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-
-        for i in range(2):
-            event += ''.join(x for x in ['90' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
-            event = event[:event.rfind('00')] + '8100'
-            event += ''.join(x for x in ['80' + '{:02x}'.format(x) + '4000' for x in self.pattern.component])
+        return event + [(2 * self.beat * len(notes), 0x80, x) for x in notes]
+
+    def _play_2(self) -> list:
+        notes = self.pattern.component
+        event = []
+        for begin, end in ((0, 2), (2, 3), (3, 4)):
+            event += [(begin * self.beat, 0x90, x) for x in notes]
+            event += [(end * self.beat, 0x80, x) for x in notes]
         return event
 
-    def _play_3(self) -> str:
-        # Press keys
-        p = ''.join(x for x in ['90' + '{:02x}'.format(x) + '4000' for x in self.pattern.component[1:]])
-        event = p + '90' + '{:02x}'.format(self.pattern.component[0]) + '408100'
-        # Release keys
-        r = ''.join(x for x in ['80' + '{:02x}'.format(x) + '4000' for x in self.pattern.component[1:]])
-        r = r[:r.rfind('00')] + '8100'
-        event += r
-        event += p
-        event = event[:event.rfind('00')] + '8100'
-        event += r
-        event += '80' + '{:02x}'.format(self.pattern.component[0]) + '4000'
-        return event
+    def _play_3(self) -> list:
+        bass, notes = self.pattern.component[0], self.pattern.component[1:]
+        # Hold the bass while pressing the other keys twice
+        event = [(0, 0x90, x) for x in notes] + [(0, 0x90, bass)]
+        event += [(self.beat, 0x80, x) for x in notes]
+        event += [(2 * self.beat, 0x90, x) for x in notes]
+        event += [(3 * self.beat, 0x80, x) for x in notes]
+        return event + [(4 * self.beat, 0x80, bass)]
 
     # chord playing patterns
     play_table = {0: _play_0, 1: _play_1, 2: _play_2, 3: _play_3}
 
-    def __init__(self, pattern, instrument=0, method=0):
+    def __init__(self, pattern, instrument=0, method=0, beat=128):
         try:
             if isinstance(pattern, str):
                 pattern = MIDI(pattern)
@@ -95,6 +98,7 @@ class MIDIChord(object):
                 self.method = method
             else:
                 raise ValueError
+            self.beat: int = beat
         except ValueError as e:
             raise e
 
@@ -104,23 +108,88 @@ class MIDIChord(object):
     def __str__(self):
         return 'MIDIPattern({}, {}, {})'.format(str(self.pattern), self.inst, self.method)
 
+    def name(self) -> str:
+        return self.pattern.chord.notation + '_' + str(self.inst) + '_' + str(self.method)
+
     def _content(self) -> bytes:
-        return bytes.fromhex(self._head() + self._track())
+        return self._head() + self._track()
 
-    def _head(self) -> str:
+    def _head(self) -> bytes:
         return self._MThd
 
-    def _track(self) -> str:
-        instrument = 'c0' + '{:02x}'.format(self.inst) + '00'
-        # 120 bpm
-        tempo = 'ff 51 03 07 A1 20 00'
-        event = self.play_table[self.method](self)
-        end = 'ff 2f 00'
-
-        data = instrument + tempo + event + end
-        thead = self._MTrk_type + '{:08x}'.format(len(bytes.fromhex(data)) + 1) + '00'
-        return thead + data
+    def _track(self) -> bytes:
+        data = bytearray()
+        # Instrument, then 120 bpm
+        data += b'\x00\xc0' + bytes([self.inst])
+        data += b'\x00\xff\x51\x03\x07\xa1\x20'
+        tick = 0
+        for time, status, note in self.play_table[self.method](self):
+            data += _vlq(time - tick)
+            data += bytes([status, note, 0x40])
+            tick = time
+        data += b'\x00\xff\x2f\x00'
+        return self._MTrk_type + len(data).to_bytes(4, 'big') + bytes(data)
 
     def write(self, filename: str):
         with open(filename, 'xb') as f:
             f.write(self._content())
+
+
+# Parse a MIDI file into its division and tracks, each a list of (tick, message) with absolute ticks.
+def parse(data: bytes) -> (int, list):
+    if data[:4] != MIDIChord._MThd[:4]:
+        raise ValueError
+    division = int.from_bytes(data[12:14], 'big')
+    tracks = []
+    i = 8 + int.from_bytes(data[4:8], 'big')
+    while i < len(data):
+        end = i + 8 + int.from_bytes(data[i + 4:i + 8], 'big')
+        if data[i:i + 4] != MIDIChord._MTrk_type:
+            i = end
+            continue
+        i += 8
+        track = []
+        tick = 0
+        status = 0
+        while i < end:
+            delta = 0
+            while True:
+                delta = (delta << 7) | (data[i] & 0x7f)
+                i += 1
+                if data[i - 1] < 0x80:
+                    break
+            tick += delta
+            # Running status reuses the previous status byte.
+            if data[i] & 0x80:
+                status = data[i]
+                i += 1
+            if status == 0xff:
+                length = data[i + 1]
+                track.append((tick, bytes([status]) + data[i:i + 2 + length]))
+                i += 2 + length
+            elif status in (0xf0, 0xf7):
+                length = data[i]
+                track.append((tick, bytes([status]) + data[i:i + 1 + length]))
+                i += 1 + length
+            else:
+                size = 1 if status & 0xf0 in (0xc0, 0xd0) else 2
+                track.append((tick, bytes([status]) + data[i:i + size]))
+                i += size
+        tracks.append(track)
+    return division, tracks
+
+
+# Contents of chords with all instruments and playing methods, as (name, content) pairs.
+def bulk(chords=None) -> Iterator[tuple]:
+    for chord in chords if chords is not None else utils.all_chords:
+        for i in MIDIChord.inst_table:
+            for j in MIDIChord.play_table.keys():
+                p = MIDIChord(chord, i, j)
+                yield p.name(), p._content()
+
+
+# Write the contents of chords into one zip archive of MIDI files.
+def write_archive(filename: str, chords=None):
+    with zipfile.ZipFile(filename, 'x') as f:
+        for name, content in bulk(chords):
+            f.writestr(name + '.mid', content)
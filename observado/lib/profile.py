@@ -0,0 +1,133 @@
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+# "log" logs each stage, a path ending in .json writes a Chrome trace there at exit, empty disables profiling.
+environment = os.environ.get('OBSERVADO_PROFILE', '')
+# Set to trace allocations with tracemalloc, which slows everything down.
+environment_memory = bool(os.environ.get('OBSERVADO_PROFILE_MEMORY'))
+
+logger = logging.getLogger('observado.profile')
+
+# Functions called with a dict for each finished stage
+_sinks = []
+_null = contextlib.nullcontext()
+_local = threading.local()
+
+
+# Time a stage of the analysis under "name", nesting in the stages around it.
+# Costs a single check when profiling is disabled.
+def stage(name: str):
+    return _Stage(name) if _sinks else _null
+
+
+# A stage is reported as a dict of its name, start time, wall and CPU seconds, and, when tracemalloc is tracing,
+# net bytes allocated and peak bytes above the start. CPU time is of the whole process.
+class _Stage(object):
+    def __init__(self, name: str):
+        self.name: str = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.memory = tracemalloc.is_tracing()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is shared by the process, so the peak so far is kept by the stage around this one.
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.current = current
+            self.peak = current
+        stack.append(self)
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        event = {'name': self.name, 'start': self.start, 'wall': wall, 'cpu': cpu, 'allocated': None, 'peak': None,
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        stack = _local.stack
+        stack.pop()
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            event['allocated'] = current - self.current
+            event['peak'] = self.peak - self.current
+        for sink in list(_sinks):
+            sink(event)
+        return False
+
+
+def log(event: dict):
+    if event['peak'] is None:
+        logger.info('%s: %.3f s wall, %.3f s CPU', event['name'], event['wall'], event['cpu'])
+    else:
+        logger.info('%s: %.3f s wall, %.3f s CPU, %+.1f MB allocated, %.1f MB peak', event['name'], event['wall'],
+                    event['cpu'], event['allocated'] / 2 ** 20, event['peak'] / 2 ** 20)
+
+
+# Stages as complete events of the Chrome trace event format, for chrome://tracing or Perfetto.
+class ChromeTrace(object):
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.events: list = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        args = {'cpu': event['cpu']}
+        if event['peak'] is not None:
+            args.update(allocated=event['allocated'], peak=event['peak'])
+        with self.lock:
+            self.events.append({'name': event['name'], 'ph': 'X', 'ts': event['start'] * 1e6,
+                                'dur': event['wall'] * 1e6, 'pid': event['pid'], 'tid': event['tid'], 'args': args})
+
+    def write(self):
+        with self.lock:
+            events = list(self.events)
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Send stages to a sink, a function taking the dict of each stage, optionally tracing allocations too.
+def enable(sink: Callable[[dict], None], memory=False):
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _sinks.append(sink)
+
+
+def disable(sink=None):
+    if sink is None:
+        _sinks.clear()
+    elif sink in _sinks:
+        _sinks.remove(sink)
+
+
+# Enable profiling as given by a command line flag or OBSERVADO_PROFILE: "log", or a .json file for a Chrome trace.
+def configure(target: str, memory=False):
+    if not target:
+        return
+    if target.endswith('.json'):
+        trace = ChromeTrace(target)
+        atexit.register(trace.write)
+        enable(trace, memory)
+    else:
+        if not logging.getLogger().handlers:
+            logging.basicConfig(format='%(name)s %(message)s')
+        logger.setLevel(logging.INFO)
+        enable(log, memory)
+
+
+configure(environment, environment_memory)
@@ -0,0 +1,26 @@
+import json
+from typing import Iterable, NamedTuple, Optional
+
+
+# A recognized chord with its boundaries in seconds. The posterior is the mean posterior probability of the chord
+# over its frames in the HMM, and the confidence is the fraction of k-NN votes for it, or None when
+# the chord was not refined by the classifiers.
+class Segment(NamedTuple):
+    start: float
+    end: float
+    chord: str
+    posterior: Optional[float] = None
+    confidence: Optional[float] = None
+
+    def json(self) -> str:
+        return json.dumps(self._asdict(), ensure_ascii=False)
+
+    def text(self) -> str:
+        return '{:.2f} {:.2f} {}'.format(self.start, self.end, self.chord)
+
+
+# Write segments as JSON lines as soon as each comes.
+def write_jsonl(segments: Iterable[Segment], output):
+    for segment in segments:
+        output.write(segment.json() + '\n')
+        output.flush()
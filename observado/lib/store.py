@@ -0,0 +1,139 @@
+import hashlib
+import os
+from typing import Optional
+
+import numpy as np
+
+from observado.lib import chords as codes
+
+dirname = os.path.dirname(__file__)
+directory = os.path.join(dirname, '../../data/features')
+# Metadata of each row as integer codes: chord codes of observado.lib.chords for notations, note values for roots
+# and basses, indexes of chords.qualities, MIDI programs and playing methods, -1 when not applicable, and the SHA-256
+# digest of what the row was computed from.
+fields = np.dtype([('notation', np.int16), ('root', np.int8), ('quality', np.int8), ('bass', np.int8),
+                   ('instrument', np.int16), ('play', np.int8), ('method', np.int8), ('key', 'S32')])
+methods = ('cqt', 'stft', 'cens', 'enhanced_cqt', 'noise')
+
+
+# Paths of the chroma, float32 frames of 12 values, and of the index of a method.
+def paths(method: str, path=None) -> (str, str):
+    path = path or directory
+    return os.path.join(path, method + '.npy'), os.path.join(path, method + '.index.npy')
+
+
+# Index row of a sound of a chord notation, "N" for noise, with hexadecimal "key".
+def record(notation: str, instrument=-1, play=-1, method='noise', key='') -> tuple:
+    if notation == 'N':
+        return codes.no_chord, -1, -1, -1, instrument, play, methods.index(method), bytes.fromhex(key)
+    chord = codes.Chord(notation)
+    return (codes.encode(notation), chord.root.value(), codes.qualities.index(chord.quality), chord.bass.value(),
+            instrument, play, methods.index(method), bytes.fromhex(key))
+
+
+# Shape and dtype of a .npy file, with the offsets of its header text and of its data.
+def _header(f) -> (tuple, np.dtype, int, int):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    # The header text follows the magic string and its length, of 2 bytes in version 1 and 4 after.
+    return shape, dtype, 10 if version == (1, 0) else 12, f.tell()
+
+
+# Append rows to a .npy file along its first axis, in place: rows are written after the data, then the shape
+# in the header is rewritten, numpy leaving room for it to grow. Files are created as needed.
+def _append(filename: str, rows: np.ndarray):
+    if not os.path.exists(filename):
+        np.save(filename, rows)
+        return
+    with open(filename, 'r+b') as f:
+        shape, dtype, start, offset = _header(f)
+        if dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+            raise ValueError
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+            np.lib.format.dtype_to_descr(dtype), (shape[0] + len(rows),) + shape[1:])
+        if len(header) + 1 <= offset - start:
+            # Rows past the shape were written by an interrupted append.
+            f.seek(offset + shape[0] * dtype.itemsize * int(np.prod(shape[1:], dtype=int)))
+            f.truncate()
+            f.write(np.ascontiguousarray(rows).tobytes())
+            f.flush()
+            # The header keeps its length, padded with spaces and ending with a newline.
+            f.seek(start)
+            f.write((header + ' ' * (offset - start - len(header) - 1) + '\n').encode('latin1'))
+            return
+    # No room left in the header
+    data = np.concatenate((np.load(filename, mmap_mode='r'), rows))
+    np.save(filename + '.tmp.npy', data)
+    os.replace(filename + '.tmp.npy', filename)
+
+
+# Append the chroma of sounds of a method with their index rows. The index is written last, so rows of chroma
+# without their index row, left by an interrupted append, are ignored and overwritten.
+def append(method: str, chroma: np.ndarray, index, path=None):
+    chroma_path, index_path = paths(method, path)
+    os.makedirs(os.path.dirname(chroma_path), exist_ok=True)
+    index = np.array(index, dtype=fields)
+    if os.path.exists(chroma_path) and os.path.exists(index_path):
+        # Drop chroma rows without an index row first.
+        n_rows = len(np.load(index_path, mmap_mode='r'))
+        if len(np.load(chroma_path, mmap_mode='r')) > n_rows:
+            _truncate(chroma_path, n_rows)
+    elif os.path.exists(chroma_path):
+        os.remove(chroma_path)
+    _append(chroma_path, np.asarray(chroma, dtype=np.float32).reshape(-1, 12))
+    _append(index_path, index)
+
+
+def _truncate(filename: str, n_rows: int):
+    array = np.array(np.load(filename, mmap_mode='r')[:n_rows])
+    np.save(filename + '.tmp.npy', array)
+    os.replace(filename + '.tmp.npy', filename)
+
+
+# Chroma and index rows of a method, as memory maps, filtered by fields of the index given as a value or a sequence
+# of values, like quality=(0, 2) or instrument=0. Filters selecting one range of rows give views of the memory maps;
+# others gather the rows they select only. Empty arrays without the store.
+def load(method: str, path=None, **filters) -> (np.ndarray, np.ndarray):
+    chroma_path, index_path = paths(method, path)
+    if not os.path.exists(index_path):
+        return np.zeros((0, 12), dtype=np.float32), np.zeros(0, dtype=fields)
+    index = np.load(index_path, mmap_mode='r')
+    chroma = np.load(chroma_path, mmap_mode='r')[:len(index)]
+    if not filters:
+        return chroma, index
+    mask = np.ones(len(index), dtype=bool)
+    for name, value in filters.items():
+        mask &= np.isin(index[name], value)
+    rows = np.flatnonzero(mask)
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return chroma[rows[0]:rows[-1] + 1], index[rows[0]:rows[-1] + 1]
+    return chroma[rows], index[rows]
+
+
+# Keep only the rows of a method selected by a mask, rewriting the store.
+def keep(method: str, mask: np.ndarray, path=None):
+    chroma, index = load(method, path)
+    if mask.all():
+        return
+    chroma_path, index_path = paths(method, path)
+    np.save(chroma_path + '.tmp.npy', np.array(chroma[mask]))
+    np.save(index_path + '.tmp.npy', np.array(index[mask]))
+    # Rows are never paired with the wrong index rows: an interruption leaves at worst an empty store,
+    # whose rows are made again.
+    np.save(index_path + '.empty.npy', np.zeros(0, dtype=fields))
+    os.replace(index_path + '.empty.npy', index_path)
+    os.replace(chroma_path + '.tmp.npy', chroma_path)
+    os.replace(index_path + '.tmp.npy', index_path)
+
+
+# Hash of the content of the store of a method, None without it.
+def digest(method: str, path=None) -> Optional[str]:
+    chroma, index = load(method, path)
+    if not len(index):
+        return None
+    h = hashlib.sha256(np.ascontiguousarray(index).tobytes())
+    h.update(np.ascontiguousarray(chroma).tobytes())
+    return h.hexdigest()
@@ -0,0 +1,72 @@
+import numpy as np
+
+from observado.lib.midi import MIDIChord, parse
+
+# Additive timbres by General MIDI program family (program // 8):
+# (amplitudes of harmonics, attack, decay, sustain level, release), times in seconds.
+timbres = {
+    # Piano
+    0: ([1, .45, .25, .15, .08, .05, .03, .02], .005, .8, .2, .2),
+    # Chromatic percussion
+    1: ([1, 0, .3, 0, .1, 0, .05], .002, .4, 0, .1),
+    # Guitar
+    3: ([1, .5, .33, .25, .2, .17, .14, .12, .11, .1], .003, 1.2, 0, .15),
+    # Strings
+    5: ([1 / x for x in range(1, 13)], .08, .3, .8, .25),
+    # Ensemble
+    6: ([1 / x for x in range(1, 11)], .1, .3, .8, .3),
+    # Brass
+    7: ([x ** -.7 for x in range(1, 11)], .04, .2, .8, .1),
+    # Synth lead
+    10: ([1 / x if x % 2 else 0 for x in range(1, 12)], .01, .1, .9, .05),
+    # Synth pad
+    11: ([x ** -2. for x in range(1, 7)], .3, 1., .7, .5),
+}
+# Timbre of programs in other families
+default = ([1, .5, .25], .01, .5, .5, .1)
+
+
+# Notes of a MIDI file, as (start time, end time, note number, velocity) with times in seconds.
+def _notes(data: bytes) -> list:
+    division, tracks = parse(data)
+    events = sorted((tick, i, message) for track in tracks for i, (tick, message) in enumerate(track))
+    tempo = 500000
+    last = 0
+    seconds = 0.
+    pressed = {}
+    notes = []
+    for tick, _, message in events:
+        seconds += (tick - last) * tempo / division / 1e6
+        last = tick
+        kind = message[0] & 0xf0
+        if message[0] == 0xff and message[1] == 0x51:
+            tempo = int.from_bytes(message[3:6], 'big')
+        elif kind == 0x90 and message[2]:
+            pressed[message[1]] = (seconds, message[2])
+        elif kind in (0x80, 0x90) and message[1] in pressed:
+            start, velocity = pressed.pop(message[1])
+            notes.append((start, seconds, message[1], velocity))
+    return sorted(notes)
+
+
+# Render a MIDIChord into a mono waveform, by additive synthesis with the timbre of its instrument.
+def render(chord: MIDIChord, sr=22050) -> np.ndarray:
+    harmonics, attack, decay, sustain, release = timbres.get(chord.inst // 8, default)
+    notes = _notes(chord._content())
+    length = max(x[1] for x in notes) + 4 * release
+    y = np.zeros(int(length * sr) + 1)
+    for start, end, note, velocity in notes:
+        frequency = 440. * 2 ** ((note - 69) / 12)
+        t = np.arange(int((end - start + 4 * release) * sr)) / sr
+        # ADSR envelope with exponential decay and release.
+        envelope = np.minimum(t / attack, 1) * (sustain + (1 - sustain) * np.exp(-np.maximum(t - attack, 0) / decay))
+        held = t >= end - start
+        if held.any():
+            envelope[held] = envelope[np.argmax(held)] * np.exp(-(t[held] - (end - start)) / release)
+        k = np.arange(1, len(harmonics) + 1)
+        amplitude = np.where(frequency * k < sr / 2, harmonics, 0)
+        wave = amplitude.dot(np.sin(2 * np.pi * frequency * np.outer(k, t)))
+        offset = int(start * sr)
+        y[offset:offset + len(t)] += velocity / 127 * envelope * wave
+    peak = np.abs(y).max()
+    return (y / peak * .8 if peak else y).astype(np.float32)
@@ -3,16 +3,12 @@ from typing import Optional
 
 import librosa
 import numpy as np
-import scipy.ndimage
-import scipy.stats
+
+from observado.lib import profile
 
 dirname = os.path.dirname(__file__)
+# Chord patterns written by generate.basic_generate
 basic = os.path.join(dirname, '../../data/features/basic.csv')
-noise = os.path.join(dirname, '../../data/features/noise.csv')
-enhanced_cqt = os.path.join(dirname, '../../data/features/wav_enhanced_cqt.csv')
-cqt = os.path.join(dirname, '../../data/features/wav_cqt.csv')
-stft = os.path.join(dirname, '../../data/features/wav_stft.csv')
-cens = os.path.join(dirname, '../../data/features/wav_cens.csv')
 
 note_values = {'C': 0, 'C#': 1, 'D': 2, 'D#': 3, 'E': 4, 'F': 5, 'F#': 6, 'G': 7, 'G#': 8, 'A': 9, 'A#': 10, 'B': 11}
 
@@ -21,20 +17,24 @@ note_alts = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#'}
 # Chord pattern for C
 chord_table = {'M': np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0]),
                'm': np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0]),
-               # 'aug': np.array([1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0]),
-               # 'dim': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0]),
                '7': np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0]),
                'm7': np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 0]),
                'maj7': np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1]),
-               # 'dim7': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0]),
-               # 'ø7': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0]),
-               # '9': np.array([1, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0]),
-               # 'add9': np.array([1, 0, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0]),
-               # 'add6': np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0]),
-               # 'sus2': np.array([1, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0]),
-               # 'sus4': np.array([1, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0]),
                }
 
+# Chord patterns for C the classifiers are not trained on, only recognized by the HMM with the full vocabulary.
+extended_chord_table = {'aug': np.array([1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0]),
+                        'dim': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0]),
+                        'dim7': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0]),
+                        'ø7': np.array([1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1, 0]),
+                        '9': np.array([1, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0]),
+                        'add9': np.array([1, 0, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0]),
+                        'add6': np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0]),
+                        'sus2': np.array([1, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0]),
+                        'sus4': np.array([1, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0]),
+                        }
+full_chord_table = {**chord_table, **extended_chord_table}
+
 all_notes = sorted(tuple(x for x in (x for x in (x for y in
                                                  ((chr(x), chr(x) + '#', chr(x) + 'b') for x in
                                                   range(ord('A'), ord('G') + 1)) for x in y))
@@ -46,17 +46,24 @@ all_chords = [(lambda x, y: x + y if y != 'M' else x)(x, y) for x in all_notes
               if x not in note_alts.keys() for y in chord_table.keys()]
 
 
+# Onset strength envelope, computed once and shared by tempo and beats.
+def onset(y: np.ndarray, sr=22050) -> np.ndarray:
+    return librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
+
+
 # Compute a float number indicating BPM.
-def tempo(y: np.ndarray, p=False) -> float:
-    env = librosa.onset.onset_strength(y)
+def tempo(y: Optional[np.ndarray], p=False, env: Optional[np.ndarray] = None) -> float:
+    import scipy.stats
+
+    env = librosa.onset.onset_strength(y=y) if env is None else env
     prior = scipy.stats.uniform(30, 300)
     t = librosa.beat.tempo(onset_envelope=env) if not p else librosa.beat.tempo(onset_envelope=env, prior=prior)
     return t[0]
 
 
 # Compute beat frames and beat time series.
-def beats(y: np.ndarray) -> (np.ndarray, np.ndarray):
-    env = librosa.onset.onset_strength(y, aggregate=np.median)
+def beats(y: Optional[np.ndarray], env: Optional[np.ndarray] = None) -> (np.ndarray, np.ndarray):
+    env = onset(y) if env is None else env
     _, b = librosa.beat.beat_track(onset_envelope=env)
     return b, librosa.frames_to_time(b)
 
@@ -70,10 +77,70 @@ def chroma(y: np.ndarray, method) -> np.ndarray:
         return np.array([])
 
 
+# Compute chromagrams of the harmonic part of a signal for several methods at once.
+# Each spectral representation is computed only once and shared by all methods, and the harmonic part
+# is separated on it by median filtering, like librosa.effects.harmonic but without going back to a waveform.
+# No separation is done if margin is None.
+def features(y: np.ndarray, methods=('cens',), margin: Optional[float] = 4, sr=22050) -> dict:
+    data = {}
+    if any(x in methods for x in ('enhanced_cqt', 'cqt', 'cens')):
+        with profile.stage('features.cqt'):
+            c = np.abs(librosa.cqt(y, sr=sr, n_bins=7 * 36, bins_per_octave=36))
+        if margin is not None:
+            with profile.stage('features.hpss'):
+                c, _ = librosa.decompose.hpss(c, margin=margin)
+        with profile.stage('features.chroma'):
+            if 'cqt' in methods:
+                data['cqt'] = librosa.feature.chroma_cqt(C=c, sr=sr, bins_per_octave=36)
+            if 'enhanced_cqt' in methods:
+                data['enhanced_cqt'] = _enhance(data['cqt'] if 'cqt' in data else
+                                                librosa.feature.chroma_cqt(C=c, sr=sr, bins_per_octave=36))
+            if 'cens' in methods:
+                data['cens'] = librosa.feature.chroma_cens(C=c, sr=sr, bins_per_octave=36)
+    if 'stft' in methods:
+        with profile.stage('features.stft'):
+            s = np.abs(librosa.stft(y))
+            if margin is not None:
+                s, _ = librosa.decompose.hpss(s, margin=margin)
+            data['stft'] = librosa.feature.chroma_stft(S=s ** 2, sr=sr)
+    return data
+
+
+# Median of the nearest frames of each frame of a chromagram by cosine distance, like
+# librosa.decompose.nn_filter(y, aggregate=np.median, metric='cosine'), but searching neighbours only within "window"
+# frames on each side, "block" frames at a time, so that time and memory grow linearly with the length instead of
+# quadratically. Up to 2 * window + 1 frames, results are those of librosa, which keeps of the k + 2 nearest frames
+# the k first in time, k being 2 * ceil(sqrt(n - 1)) for n frames searched.
+def nn_filter(y: np.ndarray, window=1024, block=256) -> np.ndarray:
+    n_frames = y.shape[1]
+    span = min(n_frames, 2 * window + 1)
+    if span < 2:
+        return y.copy()
+    k = int(2 * np.ceil(np.sqrt(span - 1)))
+    nearest = min(k + 2, span - 1)
+    norm = np.linalg.norm(y, axis=0)
+    unit = y / np.where(norm > 0, norm, 1)
+    result = np.empty_like(y)
+    for start in range(0, n_frames, block):
+        stop = min(start + block, n_frames)
+        low, high = max(start - window, 0), min(stop + window, n_frames)
+        distance = 1 - unit[:, start:stop].T.dot(unit[:, low:high])
+        offset = np.arange(low, high)[np.newaxis] - np.arange(start, stop)[:, np.newaxis]
+        distance[(offset == 0) | (np.abs(offset) > window)] = np.inf
+        index = np.sort(np.argpartition(distance, nearest - 1, axis=1)[:, :nearest], axis=1)[:, :k]
+        result[:, start:stop] = np.median(y[:, low + index], axis=-1)
+    return result
+
+
 # Compute enhanced chromagram with CQT
 def _chroma_cqtx(y: np.ndarray) -> np.ndarray:
-    y = librosa.feature.chroma_cqt(y=y, bins_per_octave=36)
-    y = np.minimum(y, librosa.decompose.nn_filter(y, aggregate=np.median, metric='cosine'))
+    return _enhance(librosa.feature.chroma_cqt(y=y, bins_per_octave=36))
+
+
+def _enhance(y: np.ndarray) -> np.ndarray:
+    import scipy.ndimage
+
+    y = np.minimum(y, nn_filter(y))
     y = scipy.ndimage.median_filter(y, size=(1, 9))
     return y
 
@@ -90,13 +157,14 @@ def _chroma_cens(y: np.ndarray) -> np.ndarray:
     return librosa.feature.chroma_cens(y=y, bins_per_octave=36)
 
 
-# Compute the mean of each piece of chromagram according to beat frames segmentation
+# Compute the mean of each piece of chromagram according to beat frames segmentation.
+# Pieces run from the start to the last frame, which is excluded, and empty pieces are NaN.
 def means(chromagram: np.ndarray, beat_frames: Optional[np.ndarray] = None) -> np.ndarray:
     if beat_frames is not None:
-        beat_frames = np.insert(beat_frames, 0, 0)
-        beat_frames = np.append(beat_frames, len(chromagram[0]) - 1)
-        return np.array(
-            [[chromagram[i][beat_frames[j]:beat_frames[j + 1]].mean()
-              for j in range(len(beat_frames) - 1)] for i in range(len(chromagram))])
+        bounds = np.concatenate(([0], beat_frames, [chromagram.shape[1] - 1])).astype(int)
+        total = np.zeros((len(chromagram), chromagram.shape[1] + 1))
+        np.cumsum(chromagram, axis=1, out=total[:, 1:])
+        with np.errstate(invalid='ignore'):
+            return (total[:, bounds[1:]] - total[:, bounds[:-1]]) / np.diff(bounds)
     else:
-        return np.array([chromagram[i].mean() for i in range(len(chromagram))])
+        return chromagram.mean(axis=1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import sys
+import tempfile
+from typing import Iterator, Optional
+
+import librosa
+import numpy as np
+
+from observado.analyze import analyze
+from observado.hmm import analyze_hmm_blocked
+from observado.lib import chords as codes
+from observado.stream import chromagram, read_blocks
+
+
+# Write the chromagram of a file as float32 frames of 12 values, returning the number of frames.
+def spill(filename: str, output, margin=64, step=2048) -> int:
+    n_frames = 0
+    for chroma in chromagram(read_blocks(filename), margin, step):
+        output.write(np.ascontiguousarray(chroma.transpose(), dtype=np.float32).tobytes())
+        n_frames += chroma.shape[1]
+    output.flush()
+    return n_frames
+
+
+# Analyze a file into (start time, end time, chord) like main.segments, for recordings of any length.
+# The file is read, resampled and analyzed in blocks, and the chromagram is kept in a memory-mapped temporary file
+# in "directory", so memory does not grow with the length of the recording. Segments are classified "block" at a time
+# and yielded as they are. Vocabularies and "same_root" are those of hmm.analyze_hmm.
+def segments(filename: str, directory=None, vocabulary=None, block=1 << 12,
+             same_root: Optional[float] = None) -> Iterator[tuple]:
+    with tempfile.TemporaryDirectory(dir=directory) as path:
+        with open(os.path.join(path, 'chroma'), 'wb') as f:
+            n_frames = spill(filename, f)
+        if not n_frames:
+            return
+        chroma = np.memmap(os.path.join(path, 'chroma'), dtype=np.float32, mode='r', shape=(n_frames, 12)).transpose()
+        chords, _, frames = analyze_hmm_blocked(chroma, directory=path, qualities=vocabulary,
+                                                same_root=same_root)
+        for start in range(0, len(chords), block):
+            bounds = frames[start:start + block + 1]
+            times = librosa.frames_to_time(bounds)
+            for i, chord in enumerate(codes.decode(analyze(chroma, chords[start:start + block], bounds))):
+                yield float(times[i]), float(times[i + 1]), chord
+        del chroma
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else librosa.util.example_audio_file()
+    for start, end, chord in segments(filename):
+        print('{:.2f} {:.2f} {}'.format(start, end, chord))
+
+
+if __name__ == '__main__':
+    main()
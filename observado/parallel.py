@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+from concurrent import futures
+from functools import partial
+from typing import Optional
+
+import numpy as np
+
+from observado.hmm import viterbi
+from observado.lib import utils
+
+hop = 512
+# Frames of each window of chromagram, and of context on each side of it
+window = 1 << 12
+margin = 64
+
+
+# Chromagram of a window of signal, cropped to the frames it owns.
+def _window(y: np.ndarray, count: int, margin: int) -> np.ndarray:
+    return utils.features(y, ('cens',), margin=4)['cens'][:, margin:margin + count]
+
+
+# Chromagram of a signal at 22050 Hz like utils.features, computed on windows of "window" frames across "jobs"
+# processes, all cores by default. Each window is computed with "margin" frames of context on both sides,
+# which are cropped so that windows join like stream.chromagram does.
+def chromagram(y: np.ndarray, window=window, margin=margin, jobs: Optional[int] = None) -> np.ndarray:
+    n_frames = 1 + len(y) // hop
+    padded = np.concatenate((np.zeros(margin * hop, dtype=y.dtype), y,
+                             np.zeros((2 * margin + window) * hop, dtype=y.dtype)))
+    starts = range(0, n_frames, window)
+    counts = [min(window, n_frames - x) for x in starts]
+    pieces = [padded[x * hop:(x + 2 * margin + n) * hop] for x, n in zip(starts, counts)]
+    if (jobs or os.cpu_count()) == 1 or len(pieces) == 1:
+        return np.concatenate([_window(x, n, margin) for x, n in zip(pieces, counts)], axis=1)
+    with futures.ProcessPoolExecutor(jobs) as executor:
+        return np.concatenate(list(executor.map(partial(_window, margin=margin), pieces, counts)), axis=1)
+
+
+# Viterbi decoding like hmm.viterbi, on windows of "window" frames overlapping by "overlap" frames across "jobs"
+# processes. The paths of two windows are joined at the frame of their overlap nearest its middle where both
+# are in the same state, or in the middle without one. Far enough from the edges of the windows, decisions no longer
+# depend on them, so with an overlap much longer than chords the path is that of the whole decoding.
+def viterbi_windows(probs: np.ndarray, trans: np.ndarray, groups: Optional[np.ndarray] = None, window=1 << 14,
+                    overlap=1 << 10, jobs: Optional[int] = None) -> np.ndarray:
+    n_steps = probs.shape[1]
+    if n_steps <= window:
+        return viterbi(probs, trans, groups)
+    starts = list(range(0, n_steps - overlap, window - overlap))
+    pieces = [probs[:, x:x + window] for x in starts]
+    with futures.ProcessPoolExecutor(jobs) as executor:
+        paths = list(executor.map(partial(viterbi, trans=trans, groups=groups), pieces))
+
+    states = paths[0]
+    for start, path in zip(starts[1:], paths[1:]):
+        # Frames of the overlap, from its start in the new window, ordered by distance to the middle.
+        shared = len(states) - start
+        order = sorted(range(shared), key=lambda x: abs(2 * x - shared))
+        join = next((x for x in order if states[start + x] == path[x]), shared // 2)
+        states = np.concatenate((states[:start + join], path[join:]))
+    return states
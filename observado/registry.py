@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from observado.lib import store, utils
+from observado.lib.cache import digest
+
+dirname = os.path.dirname(__file__)
+directory = os.environ.get('OBSERVADO_MODELS', os.path.join(dirname, '../data/models'))
+names = {True: 'major', False: 'minor'}
+
+
+# What the models are trained from: the chord tables, the qualities of each family, the chroma method,
+# and the content of its feature store in "features", store.directory by default. None without the features.
+def contents(method='cens', features=None) -> Optional[dict]:
+    from observado.analyze import Classifier
+
+    data = store.digest(method, features)
+    if data is None:
+        return None
+    return {'chord_table': {k: v.tolist() for k, v in utils.chord_table.items()},
+            'families': {names[k]: list(v) for k, v in Classifier.families.items()}, 'method': method, 'data': data}
+
+
+# Version of the models trained from given contents.
+def version(content: dict) -> str:
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+# Export a model saved by joblib to the .npz file loaded by the analysis. Written aside and moved in place,
+# so that concurrent processes never load a partial file.
+def _export(saved: str, filename: str):
+    import joblib
+    from observado.lib.knn import KNN
+
+    temp = '{}.{}.tmp.npz'.format(os.path.splitext(filename)[0], os.getpid())
+    try:
+        KNN.from_sklearn(joblib.load(saved)).save(temp)
+        os.replace(temp, filename)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+# Version and paths of the .npz models of each family, trained into a directory of their version
+# in "path" unless already there. Models are retrained only when what they are trained from changes.
+# Features are read from the store in "features", store.directory by default. Without features, the models found
+# directly in "path" are used, versioned by their content.
+def models(method='cens', path=directory, features=None) -> (str, dict):
+    content = contents(method, features)
+    if content is None:
+        files = {x: os.path.join(path, names[x] + '.npz') for x in names}
+        # Models of earlier versions may only exist as joblib files, from which the .npz files are made.
+        found = [os.path.splitext(x)[0] + '.joblib' for x in files.values()]
+        for npz, saved in zip(files.values(), found):
+            if not os.path.exists(npz) and os.path.exists(saved):
+                _export(saved, npz)
+        found = [x if os.path.exists(x) else y for x, y in zip(found, files.values())]
+        return 'local-' + hashlib.sha256(''.join(digest(x) for x in found).encode('utf-8')).hexdigest()[:10], files
+
+    name = version(content)
+    files = {x: os.path.join(path, name, names[x] + '.npz') for x in names}
+    if all(os.path.exists(x) for x in files.values()):
+        return name, files
+
+    from observado.train import train
+
+    os.makedirs(path, exist_ok=True)
+    # Trained aside and moved in place at once, so that concurrent processes never load partial models.
+    temp = tempfile.mkdtemp(prefix='.' + name, dir=path)
+    try:
+        for major in names:
+            train(major, (method,), method, output=temp, features=features)
+        with open(os.path.join(temp, 'contents.json'), 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=2, ensure_ascii=False)
+        try:
+            os.rename(temp, os.path.join(path, name))
+        except OSError:
+            # Trained by another process meanwhile.
+            if not all(os.path.exists(x) for x in files.values()):
+                raise
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+    return name, files
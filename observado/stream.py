@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+from collections import deque
+from functools import lru_cache
+from math import ceil, gcd
+from typing import Iterable, Iterator, Optional
+
+import librosa
+import numpy as np
+
+from observado.analyze import classifier
+from observado.hmm import FixedLagViterbi, _load_codes, _load_data, _load_groups, _load_transitions
+from observado.lib import chords as codes
+from observado.lib.segment import Segment
+
+sr = 22050
+hop = 512
+# Constant-Q bins of utils.features
+n_bins = 7 * 36
+bins_per_octave = 36
+
+
+# Read a file as mono blocks resampled to the sample rate of the analysis, "length" samples of the file at a time.
+# Blocks are resampled with enough context on both sides to join seamlessly.
+def read_blocks(filename: str, length=1 << 16) -> Iterator[np.ndarray]:
+    import scipy.signal
+    import soundfile
+
+    with soundfile.SoundFile(filename) as f:
+        native = f.samplerate
+        if native == sr:
+            for block in f.blocks(length, always_2d=True, dtype='float32'):
+                yield block.mean(axis=1)
+            return
+
+        up, down = sr // gcd(native, sr), native // gcd(native, sr)
+        # Steps and context are whole multiples of "down", so that they map to whole output samples.
+        step = max(length // down, 1) * down
+        pad = ceil(10 * max(up, down) / up / down + 1) * down
+        buffer = np.zeros(pad, dtype=np.float32)
+        for block in f.blocks(step, always_2d=True, dtype='float32'):
+            buffer = np.concatenate((buffer, block.mean(axis=1)))
+            while len(buffer) >= 2 * pad + step:
+                y = scipy.signal.resample_poly(buffer[:2 * pad + step], up, down)
+                yield y[pad * up // down:(pad + step) * up // down].astype(np.float32)
+                buffer = buffer[step:]
+        rest = len(buffer) - pad
+        if rest > 0:
+            y = scipy.signal.resample_poly(np.concatenate((buffer, np.zeros(pad, dtype=np.float32))), up, down)
+            yield y[pad * up // down:pad * up // down + ceil(rest * up / down)].astype(np.float32)
+
+
+# Constant-Q filters of each octave in the frequency domain, from the highest, and the square roots of the
+# lengths of all filters, built as librosa.cqt does on every call, which is most of its cost on short windows.
+@lru_cache(maxsize=None)
+def _basis() -> tuple:
+    freqs = librosa.cqt_frequencies(n_bins, fmin=librosa.note_to_hz('C1'), bins_per_octave=bins_per_octave)
+    octaves = []
+    lengths = []
+    for i in range(n_bins // bins_per_octave):
+        filters, length = librosa.filters.wavelet(freqs=freqs[n_bins - (i + 1) * bins_per_octave:
+                                                              n_bins - i * bins_per_octave], sr=sr / 2 ** i)
+        n_fft = filters.shape[1]
+        fft = np.fft.fft(filters * length[:, np.newaxis] / n_fft, axis=1)[:, :n_fft // 2 + 1]
+        octaves.append((librosa.util.sparsify_rows(fft, quantile=0.01, dtype=np.complex64) * np.sqrt(2 ** i), n_fft))
+        lengths.append(length * 2 ** i)
+    return octaves, np.sqrt(np.concatenate(lengths[::-1]))[:, np.newaxis]
+
+
+# Constant-Q magnitudes of a piece of signal like those of utils.features, with the filters of _basis.
+def _cqt(y: np.ndarray) -> np.ndarray:
+    octaves, lengths = _basis()
+    responses = []
+    for i, (basis, n_fft) in enumerate(octaves):
+        if i:
+            y = librosa.resample(y, orig_sr=2, target_sr=1, res_type='soxr_hq', scale=True)
+        responses.append(basis.dot(librosa.stft(y, n_fft=n_fft, hop_length=hop >> i, window='ones',
+                                                pad_mode='constant')))
+    n_frames = min(x.shape[1] for x in responses)
+    return np.abs(np.concatenate([x[:, :n_frames] for x in responses[::-1]])) / lengths
+
+
+# Chromagram of a piece of signal, with the same features as main.run.
+def _chroma(y: np.ndarray) -> np.ndarray:
+    c, _ = librosa.decompose.hpss(_cqt(y), margin=4)
+    return librosa.feature.chroma_cens(C=c, sr=sr, bins_per_octave=bins_per_octave)
+
+
+# Chromagram of mono blocks of audio at 22050 Hz, yielded "step" frames at a time as soon as they are final.
+# Features are computed on windows with "margin" frames of context on both sides, so that they join seamlessly,
+# and memory does not grow with the length of the input. All frames give as many frames as librosa would.
+def chromagram(blocks: Iterable[np.ndarray], margin=16, step=8) -> Iterator[np.ndarray]:
+    # The first window starts with silence as left context.
+    buffer = np.zeros(margin * hop, dtype=np.float32)
+    length = 0
+    done = 0
+    for block in blocks:
+        buffer = np.concatenate((buffer, block))
+        length += len(block)
+        while len(buffer) >= (2 * margin + step) * hop:
+            yield _chroma(buffer[:(2 * margin + step) * hop])[:, margin:margin + step]
+            buffer = buffer[step * hop:]
+            done += step
+
+    # Frames left at the end
+    rest = 1 + length // hop - done
+    if length and rest > 0:
+        buffer = np.concatenate((buffer, np.zeros((2 * margin + rest) * hop - len(buffer), dtype=np.float32)))
+        yield _chroma(buffer)[:, margin:margin + rest]
+
+
+# Recognize chords from mono blocks of audio at 22050 Hz, yielding a Segment once each is final.
+# Chords come out at most (margin + step + lag) frames after they end, under a second by default, and memory does not
+# grow with the length of the input.
+# Posteriors are filtered, given the frames up to each frame only. Vocabularies and "same_root" are those
+# of hmm.analyze_hmm.
+def records(blocks: Iterable[np.ndarray], margin=16, step=8, lag=16, qualities=None,
+            same_root: Optional[float] = None) -> Iterator[Segment]:
+    weights = _load_data(qualities)
+    states = _load_codes(qualities)
+    trans = _load_transitions(qualities, quality=same_root)
+    decoder = FixedLagViterbi(trans, lag, _load_groups(qualities))
+    forward = [np.full(len(states), 1 / len(states))]
+    # Chroma and filtered state probabilities of the undecided frames
+    pending = deque()
+    segment = {'state': None, 'start': 0, 'sum': np.zeros(12), 'count': 0, 'posterior': 0.}
+
+    def close(end: int) -> Segment:
+        state = segment['state']
+        if states[state] == codes.no_chord:
+            chord, confidence = codes.no_chord, np.nan
+        else:
+            chord, confidence = [x[0] for x in classifier().classify(
+                segment['sum'] / max(segment['count'], 1), [states[state]])]
+        return Segment(float(librosa.frames_to_time(segment['start'], sr=sr, hop_length=hop)),
+                       float(librosa.frames_to_time(end, sr=sr, hop_length=hop)), codes.decode(chord),
+                       segment['posterior'] / max(segment['count'], 1),
+                       None if np.isnan(confidence) else float(confidence))
+
+    def decide(decided: list) -> Iterator[Segment]:
+        for state in decided:
+            frame = segment['start'] + segment['count']
+            if segment['state'] is not None and state != segment['state']:
+                yield close(frame)
+                segment.update(start=frame, sum=np.zeros(12), count=0, posterior=0.)
+            chroma, prob = pending.popleft()
+            segment['state'] = state
+            segment['sum'] += chroma
+            segment['count'] += 1
+            segment['posterior'] += float(prob[state])
+
+    def push(chroma: np.ndarray) -> Iterator[Segment]:
+        probs = np.exp(weights.dot(chroma))
+        probs /= probs.sum(axis=0, keepdims=True)
+        for i in range(chroma.shape[1]):
+            forward[0] = forward[0].dot(trans) * probs[:, i]
+            forward[0] /= forward[0].sum()
+            pending.append((chroma[:, i], forward[0]))
+            yield from decide(decoder.push(probs[:, i]))
+
+    for chroma in chromagram(blocks, margin, step):
+        yield from push(chroma)
+    yield from decide(decoder.flush())
+    # The last segment ends at the last frame, as in hmm.analyze_hmm.
+    if segment['state'] is not None:
+        yield close(segment['start'] + segment['count'] - 1)
+
+
+# Same as records, yielding (start time, end time, chord).
+def stream(blocks: Iterable[np.ndarray], margin=16, step=8, lag=16, qualities=None,
+           same_root: Optional[float] = None) -> Iterator[tuple]:
+    for x in records(blocks, margin, step, lag, qualities, same_root):
+        yield x[:3]
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else librosa.util.example_audio_file()
+    for start, end, chord in stream(read_blocks(filename)):
+        print('{:.2f} {:.2f} {}'.format(start, end, chord), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import time
+from concurrent import futures
+from functools import partial
+
+import numpy as np
+
+from observado.analyze import Classifier, _quality_codes, qualities
+from observado.lib import chords as codes, store
+from observado.lib.knn import KNN, votes
+
+dirname = os.path.dirname(__file__)
+# Chroma methods of the feature store
+chroma_methods = ('cqt', 'stft', 'cens', 'enhanced_cqt')
+families = {'major': True, 'minor': False}
+# Values of k searched by default
+neighbours = (1, 3, 5, 7, 9, 11, 15, 21)
+
+
+# Chroma of the chords of a family in the feature store of a method, transposed to C, and their quality classes
+# of analyze.qualities.
+def load(method='cens', major=True, path=None) -> (np.ndarray, np.ndarray):
+    family = [codes.qualities.index(x) for x in Classifier.families[major]]
+    chroma, index = store.load(method, path, quality=family)
+    shift = index['root'].astype(int)
+    x = chroma[np.arange(len(chroma))[:, np.newaxis], (np.arange(12) + shift[:, np.newaxis]) % 12]
+    # Classes of the classifiers by quality of the store
+    classes = np.zeros(len(codes.qualities), dtype=int)
+    classes[_quality_codes[_quality_codes >= 0]] = np.flatnonzero(_quality_codes >= 0)
+    return x.astype(float), classes[index['quality']]
+
+
+# Fold of each sample for stratified k-fold cross-validation, shuffled with "seed".
+def folds(labels: np.ndarray, n_folds=5, seed=0) -> np.ndarray:
+    order = np.random.RandomState(seed).permutation(len(labels))
+    order = order[np.argsort(labels[order], kind='stable')]
+    fold = np.zeros(len(labels), dtype=int)
+    # Samples of each class are dealt to the folds in turn.
+    starts = np.searchsorted(labels[order], labels[order])
+    fold[order] = (np.arange(len(labels)) - starts) % n_folds
+    return fold
+
+
+# Predictions on one fold of the models of every k and weighting, trained on the other folds.
+# Neighbours are searched once for the largest k.
+def _evaluate(job: tuple, major=True, n_folds=5, seed=0, ks=(5,), weights=('uniform',), chunk=256,
+              features=None) -> dict:
+    method, fold = job
+    x, labels = load(method, major, features)
+    test = folds(labels, n_folds, seed) == fold
+    model = KNN.fit(x[~test], labels[~test], max(ks))
+    distance, index = [], []
+    for start in range(0, int(test.sum()), chunk):
+        d, i = model.kneighbors(x[test][start:start + chunk])
+        distance.append(d)
+        index.append(i)
+    distance, index = np.concatenate(distance), np.concatenate(index)
+    result = {}
+    for k in ks:
+        for weighting in weights:
+            proba = votes(distance[:, :k], model.y[index[:, :k]], len(model.classes), weighting)
+            result[(k, weighting)] = model.classes[np.argmax(proba, axis=1)]
+    return {'method': method, 'fold': fold, 'truth': labels[test], 'predictions': result}
+
+
+# Accuracy, and precision and recall of each quality, of predictions.
+def metrics(truth: np.ndarray, predicted: np.ndarray) -> dict:
+    names = list(qualities.keys())
+    result = {'accuracy': float(np.mean(truth == predicted)), 'qualities': {}}
+    for label in np.unique(truth):
+        chosen = predicted == label
+        result['qualities'][names[label]] = {
+            'precision': float(np.mean(truth[chosen] == label)) if chosen.any() else 0.,
+            'recall': float(np.mean(predicted[truth == label] == label)), 'support': int(np.sum(truth == label))}
+    return result
+
+
+# Cross-validate k-NN classifiers of a family over chroma methods, k and weighting across "jobs" processes,
+# fit the best one of "method", the chroma of the analysis, on all its data, and save it with a report in "output".
+# Methods are those in the feature store in "features", store.directory by default.
+def train(major=True, methods=None, method='cens', ks=neighbours, weights=('uniform', 'distance'), n_folds=5, seed=0,
+          jobs=None, output=os.path.join(dirname, '../data/models'), features=None) -> dict:
+    begin = time.perf_counter()
+    if methods is None:
+        methods = [x for x in chroma_methods if store.digest(x, features) is not None]
+    methods = tuple(methods) + ((method,) if method not in methods else ())
+    weights = tuple(weights)
+    work = [(x, y) for x in methods for y in range(n_folds)]
+    evaluate = partial(_evaluate, major=major, n_folds=n_folds, seed=seed, ks=tuple(ks), weights=weights,
+                       features=features)
+    if jobs == 1:
+        results = list(map(evaluate, work))
+    else:
+        with futures.ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(evaluate, work))
+
+    grid = []
+    for name in methods:
+        parts = [x for x in results if x['method'] == name]
+        truth = np.concatenate([x['truth'] for x in parts])
+        for k in ks:
+            for weighting in weights:
+                accuracy = [np.mean(x['truth'] == x['predictions'][(k, weighting)]) for x in parts]
+                grid.append({'method': name, 'k': k, 'weights': weighting, 'accuracy': float(np.mean(accuracy)),
+                             'std': float(np.std(accuracy)),
+                             **metrics(truth, np.concatenate([x['predictions'][(k, weighting)] for x in parts]))})
+    # Best first, the simplest model winning ties.
+    grid.sort(key=lambda x: (-x['accuracy'], x['std'], x['k'], weights.index(x['weights'])))
+    best = next(x for x in grid if x['method'] == method)
+
+    x, labels = load(method, major, features)
+    name = 'major' if major else 'minor'
+    os.makedirs(output, exist_ok=True)
+    KNN.fit(x, labels, best['k'], best['weights']).save(os.path.join(output, name + '.npz'))
+
+    report = {'family': name, 'samples': len(labels), 'folds': n_folds, 'seed': seed,
+              'best': {x: best[x] for x in ('method', 'k', 'weights', 'accuracy', 'std')},
+              'best_of_each_method': [next(y for y in grid if y['method'] == x) for x in methods],
+              'grid': grid, 'seconds': time.perf_counter() - begin}
+    with open(os.path.join(output, name + '.report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the k-NN classifiers of seventh chords with cross-validation.')
+    parser.add_argument('--families', nargs='+', choices=families.keys(), default=list(families.keys()))
+    parser.add_argument('--methods', nargs='+', choices=chroma_methods,
+                        help='chroma methods to compare, all those in the feature store by default')
+    parser.add_argument('--method', choices=chroma_methods, default='cens',
+                        help='chroma method of the saved models, that of the analysis')
+    parser.add_argument('-k', nargs='+', type=int, default=list(neighbours))
+    parser.add_argument('--weights', nargs='+', choices=('uniform', 'distance'), default=['uniform', 'distance'])
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int)
+    parser.add_argument('-o', '--output', default=os.path.join(dirname, '../data/models'))
+    parser.add_argument('--features', help='directory of the feature store, data/features by default')
+    args = parser.parse_args()
+
+    for family in args.families:
+        report = train(families[family], args.methods, args.method, args.k, args.weights, args.folds, args.seed,
+                       args.jobs, args.output, args.features)
+        best = report['best']
+        print('{}: {} k={} {} weights, accuracy {:.3f} ± {:.3f} over {} folds of {} samples in {:.1f} s'.format(
+            family, best['method'], best['k'], best['weights'], best['accuracy'], best['std'], report['folds'],
+            report['samples'], report['seconds']))
+        for other in report['best_of_each_method']:
+            if other['method'] != best['method']:
+                print('  {}: k={} {} weights, accuracy {:.3f}'.format(other['method'], other['k'], other['weights'],
+                                                                      other['accuracy']))
+
+
+if __name__ == '__main__':
+    main()
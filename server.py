@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import socketserver
+import sys
+import threading
+import time
+from concurrent import futures
+from typing import Optional
+
+from main import segments
+from observado.analyze import classifier
+
+# Default address of the analysis server, only reachable from the local machine.
+host = '127.0.0.1'
+port = 5125
+
+
+# Load the models before the first request, so that no request pays for it, returning their version.
+def warm():
+    try:
+        return classifier().version
+    except FileNotFoundError:
+        return None
+
+
+# Answer one request, {"id": ..., "file": ...}, with {"id": ..., "segments": [[start, end, chord], ...]}
+# and the version of the models, "model".
+def handle(line: str) -> dict:
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return {'id': None, 'error': 'ValueError: {}'.format(e)}
+    response = {'id': request.get('id') if isinstance(request, dict) else None}
+    try:
+        response['segments'] = segments(request['file'])
+        response['model'] = classifier().version
+    except Exception as e:
+        response['error'] = '{}: {}'.format(type(e).__name__, e)
+    return response
+
+
+# Run requests from a line stream on the pool, writing responses in order of completion.
+def serve_lines(lines, write, pool: futures.Executor):
+    lock = threading.Lock()
+
+    def reply(future):
+        with lock:
+            write(json.dumps(future.result(), ensure_ascii=False) + '\n')
+
+    pending = []
+    for line in lines:
+        if not line.strip():
+            continue
+        future = pool.submit(handle, line)
+        future.add_done_callback(reply)
+        pending.append(future)
+    futures.wait(pending)
+
+
+def serve_stdio(pool: futures.Executor):
+    def write(s):
+        sys.stdout.write(s)
+        sys.stdout.flush()
+
+    serve_lines(sys.stdin, write, pool)
+
+
+# Serve connections until shut down, or with "idle", until no connection has been open for that many seconds.
+def serve_socket(address: tuple, pool: futures.Executor, idle: Optional[float] = None):
+    lock = threading.Lock()
+    activity = {'connections': 0, 'last': time.monotonic()}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(s):
+                self.wfile.write(s.encode('utf-8'))
+                self.wfile.flush()
+
+            with lock:
+                activity['connections'] += 1
+            try:
+                serve_lines((x.decode('utf-8') for x in self.rfile), write, pool)
+            finally:
+                with lock:
+                    activity['connections'] -= 1
+                    activity['last'] = time.monotonic()
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    with Server(address, Handler) as server:
+        stopped = threading.Event()
+
+        def watch():
+            while not stopped.wait(min(idle, 1.)):
+                with lock:
+                    done = not activity['connections'] and time.monotonic() - activity['last'] > idle
+                if done:
+                    server.shutdown()
+                    return
+
+        if idle:
+            threading.Thread(target=watch, daemon=True).start()
+        try:
+            server.serve_forever()
+        finally:
+            stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-lived chord analysis server speaking line-delimited JSON.')
+    parser.add_argument('--stdio', action='store_true', help='serve requests from stdin instead of a socket')
+    parser.add_argument('--host', default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--workers', type=int, default=4, help='number of concurrent analysis jobs')
+    parser.add_argument('--idle', type=float, metavar='SECONDS',
+                        help='exit after that long without connections, never by default')
+    args = parser.parse_args()
+
+    print('Models {}'.format(warm()), file=sys.stderr, flush=True)
+    with futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+        if args.stdio:
+            serve_stdio(pool)
+        else:
+            serve_socket((args.host, args.port), pool, args.idle)
+
+
+if __name__ == '__main__':
+    main()
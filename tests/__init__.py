@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import soundfile
+
+
+# Classifier with models fitted on the chord patterns of utils.chord_table with noise, saved in "directory",
+# standing in for the trained models.
+def classifier(directory: str):
+    from observado.analyze import Classifier, qualities
+    from observado.lib import utils
+    from observado.lib.knn import KNN
+
+    random = np.random.RandomState(0)
+    files = {}
+    for major, family in Classifier.families.items():
+        x = np.concatenate([utils.chord_table[x] + random.rand(20, 12) * 0.3 for x in family])
+        files[major] = os.path.join(directory, 'major.npz' if major else 'minor.npz')
+        KNN.fit(x, np.repeat([qualities[x] for x in family], 20)).save(files[major])
+    return Classifier(files[True], files[False], 'test')
+
+
+# Write a wave file of a progression of chords of sine tones, given as MIDI notes, "seconds" each.
+def progression(filename: str, chords=((60, 64, 67), (57, 60, 64), (53, 57, 60), (55, 59, 62)), seconds=2.,
+                sr=22050):
+    t = np.arange(int(seconds * sr)) / sr
+    y = np.concatenate([sum(np.sin(2 * np.pi * 440 * 2 ** ((x - 69) / 12) * t) for x in chord) / len(chord)
+                        for chord in chords])
+    soundfile.write(filename, (0.5 * y).astype(np.float32), sr)
+    return filename
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+
+from observado.analyze import *
+from observado.analyze import _quality_names
+from tests import classifier
+
+
+class AnalyzeTestCase(unittest.TestCase):
+    def test_classify(self):
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as d:
+            model = classifier(d)
+            hmm_chords = np.random.randint(0, 24, 300)
+            hmm_chords[::7] = codes.no_chord
+            average = np.random.rand(300, 12)
+            # Some segments close to the chords of their root
+            for i in range(0, 300, 3):
+                pattern = utils.chord_table[('7', 'maj7', 'm7')[i % 9 // 3]]
+                average[i] = np.roll(pattern, hmm_chords[i] % 12) + average[i] * 0.2
+            data, confidence = model.classify(average, hmm_chords)
+            for i, chord in enumerate(hmm_chords):
+                if chord == codes.no_chord:
+                    self.assertEqual(codes.no_chord, data[i])
+                    self.assertTrue(np.isnan(confidence[i]))
+                    continue
+                root, major = chord % 12, chord // 12 == codes.qualities.index('M')
+                knn = model.models[major]
+                rolled = np.roll(average[i], -root)[np.newaxis]
+                quality = _quality_names[knn.predict(rolled)[0]]
+                self.assertEqual(12 * codes.qualities.index(quality) + root, data[i])
+                self.assertEqual(knn.predict_proba(rolled).max(), confidence[i])
+            self.assertTrue(np.array_equal(data, model.predict(average, codes.decode(hmm_chords))))
+            del model
+
+    def test_segment_means(self):
+        np.random.seed(0)
+        chroma = np.random.rand(12, 1000)
+        frames = [0, 3, 3, 250, 600, 999]
+        expected = [chroma[:, x:y].mean(axis=1) if y > x else np.full(12, np.nan) for x, y in zip(frames, frames[1:])]
+        for block in (7, 256, 1 << 16):
+            result = segment_means(chroma, frames, block)
+            self.assertTrue(np.allclose(np.nan_to_num(expected), result))
+            # From a later boundary, like a block of the segments of a long recording
+            self.assertTrue(np.allclose(result[2:], segment_means(chroma, frames[2:], block)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from batch import *
+from observado.lib.cache import FeatureCache
+from tests import classifier, progression
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        models = classifier(self.directory.name)
+        # Workers are forked with the patches.
+        for patch in (mock.patch('observado.analyze.classifier', return_value=models),
+                      mock.patch('batch.classifier', return_value=models),
+                      mock.patch('main.cache', FeatureCache(''))):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_run(self):
+        good = progression(os.path.join(self.directory.name, 'a.wav'), seconds=1.)
+        other = progression(os.path.join(self.directory.name, 'b.wav'), ((62, 66, 69),), seconds=1.)
+        bad = os.path.join(self.directory.name, 'c.wav')
+        with open(bad, 'w') as f:
+            f.write('not audio')
+        files = find([self.directory.name])
+        self.assertEqual([good, other, bad], files)
+        manifest = os.path.join(self.directory.name, 'out.jsonl.done')
+        # As if interrupted after the first file
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.write(good + '\n')
+
+        output = io.StringIO()
+        stats = run(files, output, manifest, 2)
+        records = {x['file']: x for x in map(json.loads, output.getvalue().splitlines())}
+        self.assertEqual({other, bad}, set(records))
+        self.assertEqual(['D'], [x[2] for x in records[other]['segments']])
+        self.assertEqual('test', records[other]['model'])
+        self.assertAlmostEqual(1., records[other]['duration'], delta=0.05)
+        self.assertIn('error', records[bad])
+        self.assertEqual({'files': 2, 'errors': 1, 'skipped': 1}, {x: stats[x] for x in ('files', 'errors', 'skipped')})
+        self.assertEqual(records[other]['duration'], stats['audio'])
+        self.assertGreater(stats['elapsed'], 0)
+        # Files are recorded as done once written, failures are retried.
+        with open(manifest, encoding='utf-8') as f:
+            self.assertEqual([good, other], f.read().splitlines())
+        output = io.StringIO()
+        stats = run(files, output, manifest, 1)
+        self.assertEqual([bad], [json.loads(x)['file'] for x in output.getvalue().splitlines()])
+        self.assertEqual({'files': 1, 'errors': 1, 'skipped': 2}, {x: stats[x] for x in ('files', 'errors', 'skipped')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from observado.lib.cache import *
+
+
+class CacheTestCase(unittest.TestCase):
+    def test_fetch(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'a.wav')
+            with open(filename, 'wb') as f:
+                f.write(b'RIFF')
+            cache = FeatureCache(os.path.join(d, 'cache'), 1 << 20)
+            calls = []
+
+            def compute():
+                calls.append(1)
+                return np.ones((12, 10))
+
+            self.assertTrue(np.array_equal(np.ones((12, 10)), cache.fetch(filename, compute, method='cens')))
+            self.assertTrue(np.array_equal(np.ones((12, 10)), cache.fetch(filename, compute, method='cens')))
+            self.assertEqual(1, len(calls))
+            cache.fetch(filename, compute, method='cqt')
+            self.assertEqual(2, len(calls))
+            self.assertNotEqual(cache.key(filename, method='cens'), cache.key(filename, method='cqt'))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = FeatureCache(d, 3 * (128 + 12 * 100 * 4))
+            for i in range(3):
+                cache.put(str(i), np.zeros((12, 100)))
+                os.utime(os.path.join(d, str(i) + '.npy'), (i, i))
+            cache.get('0')
+            cache.put('3', np.zeros((12, 100)))
+            self.assertEqual(['0.npy', '2.npy', '3.npy'], sorted(os.listdir(d)))
+            self.assertIsNone(cache.get('1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
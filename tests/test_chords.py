@@ -49,6 +49,24 @@ class ChordTestCase(unittest.TestCase):
         self.assertTrue(p.available)
         self.assertEqual(str(p.array), str(np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1])))
 
+    def test_interned(self):
+        self.assertIs(Note('Bb'), Note('Bb'))
+        self.assertIs(Chord('Am7'), Chord('Am7'))
+        self.assertIs(Pattern('Am7'), Pattern(Chord('Am7')))
+        self.assertFalse(hasattr(Chord('Am7'), '__dict__'))
+        self.assertEqual(repr(Chord('C#m7/E')),
+                         "Chord({'root': Note(C#), 'quality': 'm7', 'notation': 'C#m7/E', 'bass': Note(E)})")
+        self.assertFalse(Pattern('C').array.flags.writeable)
+
+    def test_codes(self):
+        self.assertEqual(0, encode('C'))
+        self.assertEqual(12 + 9, encode('Am'))
+        self.assertEqual(no_chord, encode('N'))
+        self.assertEqual('C#maj7', decode(encode('Dbmaj7')))
+        self.assertEqual(['G7', 'N'], decode(np.array([encode('G7'), no_chord])))
+        self.assertEqual(list(labels), decode(np.arange(no_chord + 1)))
+        self.assertRaises(ValueError, encode, 'C/G')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from observado import generate
+from observado.lib import chords as codes, store, utils
+from observado.lib.midi import MIDIChord
+
+
+class GenerateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.saved = generate.all_chords, MIDIChord.inst_table
+        generate.all_chords = ['C']
+        MIDIChord.inst_table = [0]
+
+    def tearDown(self):
+        generate.all_chords, MIDIChord.inst_table = self.saved
+        self.directory.cleanup()
+
+    def rows(self, method='cens') -> (np.ndarray, np.ndarray):
+        chroma, index = store.load(method, self.directory.name)
+        return np.array(chroma), np.array(index)
+
+    def test_artifacts(self):
+        keys = [x['key'] for x in generate.artifacts(['C', 'Am'])]
+        self.assertEqual(2 * 4 * len(generate.methods), len(set(keys)))
+        self.assertEqual(keys, [x['key'] for x in generate.artifacts(['C', 'Am'])])
+        self.assertNotEqual(keys[:8], [x['key'] for x in generate.artifacts(['C'], timidity=True)][:8])
+        # Features are out of date when the code computing them changes, and only then.
+        with mock.patch.dict(utils.chord_table, aug=utils.full_chord_table['aug']):
+            self.assertEqual(keys, [x['key'] for x in generate.artifacts(['C', 'Am'])])
+        with mock.patch.object(utils, 'nn_filter', utils.means):
+            self.assertTrue(set(keys).isdisjoint(x['key'] for x in generate.artifacts(['C', 'Am'])))
+
+    def test_incremental(self):
+        generate.wave_feature_generate(workers=1, features=self.directory.name)
+        chroma, index = self.rows()
+        self.assertEqual((4, 12), chroma.shape)
+        self.assertEqual([0, 1, 2, 3], sorted(index['play']))
+        # Rows out of date are dropped.
+        store.append('cens', chroma[:1], [store.record('C', 0, 0, 'cens', 'f' * 64)], self.directory.name)
+        self.assertEqual(5, len(self.rows()[1]))
+        generate.wave_feature_generate(workers=1, features=self.directory.name)
+        self.assertTrue(np.array_equal(index, self.rows()[1]))
+        # Only the sounds of a new instrument are made.
+        MIDIChord.inst_table = [0, 40]
+        generate.wave_feature_generate(workers=1, features=self.directory.name)
+        self.assertTrue(np.array_equal(chroma, self.rows()[0][:4]))
+        self.assertEqual(8, len(self.rows('stft')[1]))
+
+    def test_new_quality(self):
+        generate.wave_feature_generate(workers=1, features=self.directory.name)
+        chroma, index = self.rows()
+        # Only the chords of a new quality are made.
+        with mock.patch.dict(utils.chord_table, aug=utils.full_chord_table['aug']):
+            generate.all_chords = ['C', 'Caug']
+            generate.wave_feature_generate(workers=1, features=self.directory.name)
+        new_chroma, new_index = self.rows()
+        self.assertTrue(np.array_equal(chroma, new_chroma[:4]))
+        self.assertTrue(np.array_equal(index, new_index[:4]))
+        self.assertEqual(['Caug'] * 4, codes.decode(new_index['notation'][4:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
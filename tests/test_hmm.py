@@ -0,0 +1,115 @@
+import unittest
+from unittest import mock
+
+from observado.hmm import *
+from observado.hmm import _group_step, _load_data, _load_groups, _load_labels, _load_transitions, _structured_step
+
+
+class HMMTestCase(unittest.TestCase):
+    def test_viterbi(self):
+        np.random.seed(0)
+        probs = np.random.rand(3, 25, 300) ** 4
+        probs /= probs.sum(axis=1, keepdims=True)
+        trans = librosa.sequence.transition_loop(25, 0.9)
+        expected = [librosa.sequence.viterbi_discriminative(x, trans) for x in probs]
+        self.assertTrue(np.array_equal(expected[0], viterbi_loop(probs[0], 0.9)))
+        self.assertTrue(np.array_equal(expected, viterbi_loop(probs, 0.9)))
+        self.assertTrue(np.array_equal(expected, viterbi(probs, trans)))
+        large = np.random.rand(120, 300) ** 4
+        large /= large.sum(axis=0, keepdims=True)
+        trans = librosa.sequence.transition_loop(120, 0.8)
+        self.assertTrue(np.array_equal(librosa.sequence.viterbi_discriminative(large, trans), viterbi(large, trans)))
+        # Matrices of other structures fall back to the dense decoder.
+        trans = np.random.rand(25, 25)
+        trans /= trans.sum(axis=1, keepdims=True)
+        self.assertTrue(np.array_equal(librosa.sequence.viterbi_discriminative(probs[0], trans),
+                                       viterbi(probs[0], trans)))
+
+    def test_vocabulary(self):
+        weights = _load_data('full')
+        labels = _load_labels('full')
+        self.assertEqual((169, 12), weights.shape)
+        self.assertTrue(np.allclose(3, weights.sum(axis=1)))
+        self.assertEqual(['C', 'C#', 'Cm', 'Cø7', 'Bsus4', 'N'], [labels[x] for x in (0, 1, 12, 96, 167, 168)])
+        self.assertTrue(np.array_equal(librosa.sequence.transition_loop(25, 0.9), _load_transitions()))
+
+    def test_grouped(self):
+        np.random.seed(0)
+        groups = _load_groups('full')
+        trans = _load_transitions('full', 0.9, 3.)
+        self.assertTrue(np.allclose(1, trans.sum(axis=1)))
+        self.assertGreater(trans[0, 12], trans[0, 1])
+        probs = np.random.rand(169, 300) ** 6
+        probs /= probs.sum(axis=0, keepdims=True)
+        step = _structured_step(trans, groups)
+        self.assertIs(_group_step, step.func)
+        expected = librosa.sequence.viterbi_discriminative(probs, trans)
+        self.assertTrue(np.array_equal(expected, viterbi(probs[np.newaxis], trans, groups)[0]))
+        # Ties go to the lower state.
+        probs = np.random.randint(1, 4, probs.shape).astype(float)
+        probs /= probs.sum(axis=0, keepdims=True)
+        self.assertTrue(np.array_equal(librosa.sequence.viterbi_discriminative(probs, trans),
+                                       viterbi(probs[np.newaxis], trans, groups)[0]))
+        decoder = FixedLagViterbi(trans, 20, groups)
+        states = [x for i in range(300) for x in decoder.push(probs[:, i])] + decoder.flush()
+        self.assertEqual(300, len(states))
+
+    def test_fixed_lag(self):
+        np.random.seed(0)
+        probs = np.random.rand(25, 200)
+        probs /= probs.sum(axis=0, keepdims=True)
+        trans = librosa.sequence.transition_loop(25, 0.9)
+        # With a lag longer than the input, the decoding is exact.
+        decoder = FixedLagViterbi(trans, 300)
+        states = [x for i in range(200) for x in decoder.push(probs[:, i])] + decoder.flush()
+        self.assertEqual(list(librosa.sequence.viterbi_discriminative(probs, trans)), states)
+        decoder = FixedLagViterbi(trans, 10)
+        states = [x for i in range(200) for x in decoder.push(probs[:, i])]
+        self.assertEqual(190, len(states))
+        self.assertEqual(200, len(states + decoder.flush()))
+
+    def test_posteriors(self):
+        np.random.seed(0)
+        probs = np.random.rand(3, 5)
+        trans = librosa.sequence.transition_loop(3, 0.7)
+        # Sum over every path of 5 frames
+        expected = np.zeros((3, 5))
+        for path in np.ndindex(*[3] * 5):
+            p = probs[path[0], 0] / 3 * np.prod([trans[path[t - 1], path[t]] * probs[path[t], t] for t in range(1, 5)])
+            expected[list(path), range(5)] += p
+        self.assertTrue(np.allclose(expected / expected.sum(axis=0), posteriors(probs, trans)))
+        chroma = np.random.rand(12, 500)
+        chords, times, frames, posterior = analyze_hmm(chroma, posterior=True)
+        self.assertTrue(np.array_equal(analyze_hmm(chroma)[0], chords))
+        self.assertEqual(len(chords), len(posterior))
+        self.assertTrue(np.all((posterior > 0) & (posterior <= 1)))
+
+    def test_blocked(self):
+        np.random.seed(0)
+        chroma = np.random.rand(12, 2000)
+        expected = analyze_hmm(chroma)
+        for block in (1, 333, 1 << 14):
+            chords, times, frames = analyze_hmm_blocked(chroma, block)
+            self.assertTrue(np.array_equal(expected[0], chords))
+            self.assertEqual(expected[2], frames)
+            self.assertTrue(np.array_equal(expected[1], times))
+
+    def test_same_root(self):
+        np.random.seed(0)
+        groups = _load_groups('full')
+        # The full vocabulary changes quality on the same root more easily by default, with the grouped decoder.
+        trans = _load_transitions('full')
+        self.assertAlmostEqual(same_roots['full'], trans[0, 12] / trans[0, 1])
+        self.assertIs(_group_step, _structured_step(trans, groups).func)
+        self.assertTrue(np.array_equal(librosa.sequence.transition_loop(169, stay),
+                                       _load_transitions('full', quality=1.)))
+        chroma = np.random.rand(12, 300) ** 4
+        chords = analyze_hmm(chroma, qualities='full')[0]
+        self.assertTrue(np.array_equal(chords, analyze_hmm_blocked(chroma, 100, qualities='full')[0]))
+        with mock.patch.dict(same_roots, {'full': 50.}):
+            self.assertTrue(np.array_equal(analyze_hmm(chroma, qualities='full', same_root=50.)[0],
+                                           analyze_hmm(chroma, qualities='full')[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
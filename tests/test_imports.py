@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+import unittest
+
+root = os.path.join(os.path.dirname(__file__), '..')
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy(self):
+        # Plotting, training and data generation are not loaded for analysis.
+        for module in ('main', 'server', 'observado.stream'):
+            output = subprocess.run([sys.executable, '-c', 'import sys, {}; print(*sys.modules)'.format(module)],
+                                    cwd=root, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+            loaded = {x.split('.')[0] for x in output.split()}
+            for name in ('matplotlib', 'pandas', 'sklearn', 'tqdm'):
+                self.assertNotIn(name, loaded, module)
+
+
+if __name__ == '__main__':
+    unittest.main()
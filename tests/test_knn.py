@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from sklearn.neighbors import KNeighborsClassifier
+
+from observado.lib.knn import *
+
+
+class KNNTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.x = np.random.rand(200, 12)
+        self.y = np.random.choice([0, 2, 4], 200)
+        self.q = np.random.rand(500, 12)
+
+    def test_predict(self):
+        for weights in ('uniform', 'distance'):
+            clf = KNeighborsClassifier(weights=weights).fit(self.x, self.y)
+            knn = KNN.from_sklearn(clf)
+            self.assertTrue(np.array_equal(clf.predict(self.q), knn.predict(self.q)))
+            self.assertTrue(np.allclose(clf.predict_proba(self.q), knn.predict_proba(self.q)))
+            self.assertTrue(np.array_equal(clf.predict(self.q), KNN.fit(self.x, self.y, 5, weights).predict(self.q)))
+
+    def test_kneighbors(self):
+        knn = KNN.fit(self.x, self.y, 7)
+        distance, index = knn.kneighbors(self.q, chunk=33)
+        expected = np.sqrt(((self.q[:, np.newaxis] - self.x[np.newaxis]) ** 2).sum(axis=-1))
+        self.assertTrue(np.array_equal(np.argsort(expected, axis=1)[:, :7], index))
+        self.assertTrue(np.allclose(np.sort(expected, axis=1)[:, :7], distance))
+        self.assertTrue(np.array_equal(index, knn.kneighbors(self.q)[1]))
+        self.assertEqual((0, 7), knn.kneighbors(np.zeros((0, 12)))[0].shape)
+
+    def test_save(self):
+        knn = KNN.fit(self.x, self.y, 3)
+        with tempfile.TemporaryDirectory() as d:
+            knn.save(os.path.join(d, 'model.npz'))
+            model = KNN.load(os.path.join(d, 'model.npz'))
+            self.assertIsInstance(model.x, np.memmap)
+            self.assertEqual(3, model.k)
+            self.assertTrue(np.array_equal(knn.predict(self.q), model.predict(self.q)))
+            del model
+
+
+if __name__ == '__main__':
+    unittest.main()
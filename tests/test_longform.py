@@ -0,0 +1,26 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import main
+from observado.lib.cache import FeatureCache
+from observado.longform import segments
+from tests import classifier, progression
+
+
+class LongformTestCase(unittest.TestCase):
+    def test_segments(self):
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch('observado.analyze.classifier', return_value=classifier(d)), \
+                mock.patch.object(main, 'cache', FeatureCache('')):
+            filename = progression(os.path.join(d, 'song.wav'))
+            expected = main.segments(filename)
+            self.assertEqual(['C', 'Am', 'F', 'G'], [x[2] for x in expected])
+            self.assertEqual(expected, list(segments(filename, d)))
+            # Classified a few segments at a time
+            self.assertEqual(expected, list(segments(filename, d, block=3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
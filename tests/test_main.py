@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import soundfile
+
+from main import *
+from observado.lib.cache import FeatureCache
+from tests import classifier, progression
+
+
+class MainTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for patch in (mock.patch('observado.analyze.classifier', return_value=classifier(self.directory.name)),
+                      mock.patch('main.cache', FeatureCache(''))):
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Chords of 2 seconds over clicks every half second, so that there are more beats than changes.
+        self.filename = progression(os.path.join(self.directory.name, 'song.wav'))
+        y, sr = soundfile.read(self.filename)
+        y += 0.3 * librosa.clicks(times=np.arange(0, 8, 0.5), sr=sr, length=len(y))
+        soundfile.write(self.filename, y.astype(np.float32), sr)
+
+    def test_beats(self):
+        beats = beat_frames(self.filename)
+        self.assertGreater(len(beats), 8)
+        c = chroma(self.filename)
+        chords, times, frames, posterior = analyze_beats(c, beats, posterior=True)
+        self.assertEqual(0, frames[0])
+        self.assertEqual(c.shape[1] - 1, frames[-1])
+        self.assertTrue(set(frames[1:-1]) <= set(beats))
+        self.assertTrue(np.allclose(librosa.frames_to_time(frames), times))
+        self.assertTrue(np.all((posterior > 0) & (posterior <= 1)))
+        self.assertEqual(3, len(analyze_beats(c, beats)))
+
+        expected = segments(self.filename)
+        result = segments(self.filename, beats=True)
+        self.assertEqual(['C', 'Am', 'F', 'G'], [x[2] for x in expected])
+        self.assertEqual([x[2] for x in expected], [x[2] for x in result])
+        # Changes move to the nearest beats.
+        for x, y in zip(expected, result):
+            self.assertLess(abs(x[0] - y[0]), 0.25)
+
+    def test_records(self):
+        with mock.patch('main.analyze_hmm', wraps=analyze_hmm) as hmm:
+            self.assertEqual([None] * 4, [x.posterior for x in records(self.filename)])
+            self.assertFalse(hmm.call_args.kwargs['posterior'])
+        result = list(records(self.filename, posterior=True))
+        self.assertTrue(all(0 < x.posterior <= 1 for x in result))
+        self.assertEqual(segments(self.filename), [x[:3] for x in result])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
 from observado.lib.midi import *
+from observado.lib.midi import _vlq
 
 
 class MIDITestCase(unittest.TestCase):
@@ -17,6 +18,31 @@ class MIDITestCase(unittest.TestCase):
         self.assertIsInstance(MIDIChord(Pattern(Chord('Am7'))), MIDIChord)
         self.assertIsInstance(MIDIChord(MIDI(Chord('Am7'))), MIDIChord)
 
+    def test_encode(self):
+        self.assertEqual(b'\x00', _vlq(0))
+        self.assertEqual(b'\x7f', _vlq(127))
+        self.assertEqual(b'\x84\x00', _vlq(512))
+        self.assertEqual(b'\xff\xff\x7f', _vlq(0x1fffff))
+        self.assertEqual(bytes.fromhex('4d546864000000060001000100804d54726b0000002f00c00000ff510307a120'
+                                       '0090304000903c400090404000904340840080304000803c400080404000804340'
+                                       '00ff2f00'),
+                         MIDIChord('C')._content())
+
+    def test_parse(self):
+        for method in MIDIChord.play_table.keys():
+            p = MIDIChord('Am7', 24, method, beat=1000)
+            division, tracks = parse(p._content())
+            self.assertEqual(128, division)
+            self.assertEqual(1, len(tracks))
+            self.assertEqual((0, bytes([0xc0, 24])), tracks[0][0])
+            events = [(t, m[0], m[1]) for t, m in tracks[0] if m[0] in (0x80, 0x90)]
+            self.assertEqual(p.play_table[method](p), events)
+
+    def test_bulk(self):
+        contents = dict(bulk(['C', 'Am7']))
+        self.assertEqual(2 * len(MIDIChord.inst_table) * len(MIDIChord.play_table), len(contents))
+        self.assertEqual(MIDIChord('Am7', 41, 2)._content(), contents['Am7_41_2'])
+
 
 if __name__ == '__main__':
     unittest.main()
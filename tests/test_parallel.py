@@ -0,0 +1,33 @@
+import unittest
+
+import librosa
+import numpy as np
+
+from observado.hmm import _load_groups, _load_transitions, viterbi
+from observado.parallel import *
+from observado.stream import chromagram as stream_chromagram
+
+
+class ParallelTestCase(unittest.TestCase):
+    def test_chromagram(self):
+        np.random.seed(0)
+        # A length for which the stream ends on the same windows
+        y = librosa.tone(440, length=136 * 512) + 0.1 * np.random.randn(136 * 512)
+        expected = np.concatenate(list(stream_chromagram([y], 16, 40)), axis=1)
+        self.assertEqual((12, 1 + len(y) // 512), expected.shape)
+        self.assertTrue(np.allclose(expected, chromagram(y, 40, 16, jobs=1)))
+        self.assertTrue(np.allclose(expected, chromagram(y, 40, 16, jobs=2)))
+
+    def test_viterbi_windows(self):
+        np.random.seed(0)
+        states = np.repeat(np.random.randint(0, 25, 100), 50)
+        probs = np.random.rand(25, len(states))
+        probs[states, np.arange(len(states))] += 1
+        probs /= probs.sum(axis=0, keepdims=True)
+        trans = _load_transitions(None)
+        expected = viterbi(probs, trans, _load_groups(None))
+        self.assertTrue(np.array_equal(expected, viterbi_windows(probs, trans, _load_groups(None), 1000, 200, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
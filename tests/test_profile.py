@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from observado.lib import profile
+
+
+class ProfileTestCase(unittest.TestCase):
+    def tearDown(self):
+        profile.disable()
+        tracemalloc.stop()
+
+    def test_disabled(self):
+        self.assertIs(profile.stage('a'), profile.stage('b'))
+
+    def test_stage(self):
+        events = []
+        profile.enable(events.append, memory=True)
+        with profile.stage('outer'):
+            with profile.stage('inner'):
+                x = np.ones(1 << 20)
+            del x
+        profile.disable(events.append)
+        self.assertEqual(['inner', 'outer'], [x['name'] for x in events])
+        inner, outer = events
+        self.assertGreaterEqual(inner['allocated'], 8 << 20)
+        # The peak of the inner stage counts for the outer one, after it was freed.
+        self.assertGreaterEqual(outer['peak'], 8 << 20)
+        self.assertLess(outer['allocated'], 1 << 20)
+        self.assertGreaterEqual(outer['wall'], inner['wall'])
+
+    def test_chrome_trace(self):
+        with tempfile.TemporaryDirectory() as d:
+            trace = profile.ChromeTrace(os.path.join(d, 'trace.json'))
+            profile.enable(trace)
+            with profile.stage('a'):
+                pass
+            trace.write()
+            with open(trace.filename) as f:
+                events = json.load(f)['traceEvents']
+        self.assertEqual(['a'], [x['name'] for x in events])
+        self.assertEqual('X', events[0]['ph'])
+        self.assertNotIn('peak', events[0]['args'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from observado import registry
+from observado.lib import store
+from observado.lib.chords import Pattern
+from observado.lib.knn import KNN
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.features = os.path.join(self.directory.name, 'features')
+        self.write(('C', 'G7', 'Fmaj7', 'Am', 'Dm7'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, chords):
+        for chord in chords:
+            chroma = Pattern(chord).array + np.random.rand(10, 12) * 0.3
+            store.append('cens', chroma, [store.record(chord, 0, 0, 'cens')] * 10, self.features)
+
+    def test_models(self):
+        path = os.path.join(self.directory.name, 'models')
+        version, files = registry.models(path=path, features=self.features)
+        self.assertEqual(os.path.join(path, version, 'major.npz'), files[True])
+        self.assertIsInstance(KNN.load(files[False]).x, np.memmap)
+        # Not retrained while nothing changes
+        modified = os.stat(files[True]).st_mtime_ns
+        self.assertEqual((version, files), registry.models(path=path, features=self.features))
+        self.assertEqual(modified, os.stat(files[True]).st_mtime_ns)
+        # Retrained when the training data changes
+        self.write(('E',))
+        other, files = registry.models(path=path, features=self.features)
+        self.assertNotEqual(version, other)
+        self.assertTrue(all(os.path.exists(x) for x in files.values()))
+        self.assertEqual(sorted([version, other]), sorted(os.listdir(path)))
+
+    def test_local(self):
+        missing = os.path.join(self.directory.name, 'missing')
+        KNN.fit(np.eye(12), np.arange(12) % 2).save(os.path.join(self.directory.name, 'major.npz'))
+        KNN.fit(np.eye(12), np.arange(12) % 3).save(os.path.join(self.directory.name, 'minor.npz'))
+        version, files = registry.models(path=self.directory.name, features=missing)
+        self.assertTrue(version.startswith('local-'))
+        self.assertEqual(os.path.join(self.directory.name, 'minor.npz'), files[False])
+
+    def test_export(self):
+        import joblib
+        from sklearn.neighbors import KNeighborsClassifier
+
+        missing = os.path.join(self.directory.name, 'missing')
+        path = os.path.join(self.directory.name, 'models')
+        os.makedirs(path)
+        for name in ('major', 'minor'):
+            clf = KNeighborsClassifier(1).fit(np.eye(12), np.arange(12) % 2)
+            joblib.dump(clf, os.path.join(path, name + '.joblib'))
+        version, files = registry.models(path=path, features=missing)
+        self.assertTrue(all(os.path.exists(x) for x in files.values()))
+        self.assertEqual(['major.joblib', 'major.npz', 'minor.joblib', 'minor.npz'],
+                         sorted(os.listdir(path)))
+        self.assertTrue(np.array_equal(np.arange(12) % 2, KNN.load(files[True]).predict(np.eye(12))))
+        # Exported once, the version does not change.
+        self.assertEqual(version, registry.models(path=path, features=missing)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import io
+import json
+import unittest
+
+from observado.lib.segment import *
+
+
+class SegmentTestCase(unittest.TestCase):
+    def test_segment(self):
+        segment = Segment(0.5, 2.125, 'Am')
+        self.assertEqual('0.50 2.12 Am', segment.text())
+        self.assertEqual({'start': 0.5, 'end': 2.125, 'chord': 'Am', 'posterior': None, 'confidence': None},
+                         json.loads(segment.json()))
+        self.assertEqual((0.5, 2.125, 'Am'), segment[:3])
+
+    def test_write_jsonl(self):
+        output = io.StringIO()
+        write_jsonl([Segment(0., 1., 'C', 0.9, 1.), Segment(1., 2., 'N', 0.5)], output)
+        lines = [json.loads(x) for x in output.getvalue().splitlines()]
+        self.assertEqual(['C', 'N'], [x['chord'] for x in lines])
+        self.assertEqual([1., None], [x['confidence'] for x in lines])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from server import *
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        patches = (mock.patch('server.segments', return_value=[(0., 2.02, 'C'), (2.02, 4., 'Am')]),
+                   mock.patch('server.classifier', return_value=mock.Mock(version='test')))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_handle(self):
+        self.assertEqual({'id': 1, 'segments': [(0., 2.02, 'C'), (2.02, 4., 'Am')], 'model': 'test'},
+                         handle('{"id": 1, "file": "song.wav"}'))
+        response = handle('{"id": 2')
+        self.assertIsNone(response['id'])
+        self.assertTrue(response['error'].startswith('ValueError'))
+        response = handle('[1, 2]')
+        self.assertIsNone(response['id'])
+        self.assertTrue(response['error'].startswith('TypeError'))
+        response = handle('{"id": 3}')
+        self.assertEqual(3, response['id'])
+        self.assertTrue(response['error'].startswith('KeyError'))
+        self.assertNotIn('segments', response)
+
+    def test_serve_lines(self):
+        lines = ['{"id": 1, "file": "a.wav"}\n', '\n', 'nonsense\n', '{"id": 2, "file": "b.wav"}\n']
+        output = []
+        with futures.ThreadPoolExecutor(2) as pool:
+            serve_lines(lines, output.append, pool)
+        responses = [json.loads(x) for x in output]
+        self.assertTrue(all(x.endswith('\n') for x in output))
+        self.assertEqual([1, 2], sorted(x['id'] for x in responses if x['id'] is not None))
+        self.assertEqual(['ValueError'], [x['error'].split(':')[0] for x in responses if x['id'] is None])
+        self.assertEqual([['C', 'Am']] * 2, [[y[2] for y in x['segments']] for x in responses if x['id']])
+
+    def test_idle(self):
+        with futures.ThreadPoolExecutor(1) as pool, socket.socket() as probe:
+            probe.bind((host, 0))
+            address = probe.getsockname()
+            probe.close()
+            thread = threading.Thread(target=serve_socket, args=(address, pool, 0.5))
+            thread.start()
+            for _ in range(50):
+                try:
+                    sock = socket.create_connection(address, timeout=5)
+                    break
+                except ConnectionRefusedError:
+                    time.sleep(0.1)
+            with sock, sock.makefile('rw', encoding='utf-8') as f:
+                f.write('{"id": 1, "file": "a.wav"}\n')
+                f.flush()
+                self.assertEqual('test', json.loads(f.readline())['model'])
+            # Exits on its own once no connection is open for long enough.
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from observado.lib.store import *
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record(self):
+        index = np.array([record('C#m7', 24, 1, 'cens', 'ab' * 32), record('N')], dtype=fields)
+        self.assertEqual([codes.encode('C#m7'), codes.no_chord], index['notation'].tolist())
+        self.assertEqual([1, -1], index['root'].tolist())
+        self.assertEqual([codes.qualities.index('m7'), -1], index['quality'].tolist())
+        self.assertEqual([24, -1], index['instrument'].tolist())
+        self.assertEqual(bytes.fromhex('ab' * 32), index['key'][0])
+
+    def test_append(self):
+        chroma = np.random.rand(300, 12).astype(np.float32)
+        index = [record(('C', 'Am', 'G7')[i % 3], i % 5, i % 4, 'cens') for i in range(300)]
+        # Appending again and again rewrites the shape in the header of the same files.
+        for start in range(0, 300, 7):
+            append('cens', chroma[start:start + 7], index[start:start + 7], self.path)
+        loaded, rows = load('cens', self.path)
+        self.assertIsInstance(loaded, np.memmap)
+        self.assertTrue(np.array_equal(chroma, loaded))
+        self.assertTrue(np.array_equal(np.array(index, dtype=fields), rows))
+        # Chroma rows without their index rows are ignored, then overwritten.
+        np.save(paths('cens', self.path)[0], np.concatenate((chroma, chroma[:3])))
+        self.assertEqual(300, len(load('cens', self.path)[0]))
+        append('cens', chroma[:1], index[:1], self.path)
+        self.assertTrue(np.array_equal(chroma[0], load('cens', self.path)[0][-1]))
+
+    def test_load(self):
+        chroma = np.random.rand(30, 12)
+        append('cens', chroma, [record(x) for x in ['C'] * 10 + ['Am'] * 10 + ['C'] * 10], self.path)
+        # One range of rows is a view of the memory map.
+        part, rows = load('cens', self.path, quality=codes.qualities.index('m'))
+        self.assertIsInstance(part, np.memmap)
+        self.assertTrue(np.allclose(chroma[10:20], part))
+        part, rows = load('cens', self.path, notation=[codes.encode('C')], root=0)
+        self.assertTrue(np.allclose(np.concatenate((chroma[:10], chroma[20:])), part))
+        self.assertEqual((0, 12), load('stft', self.path)[0].shape)
+        self.assertIsNone(digest('stft', self.path))
+
+    def test_keep(self):
+        append('cens', np.random.rand(10, 12), [record('C')] * 10, self.path)
+        before = digest('cens', self.path)
+        keep('cens', np.arange(10) % 2 == 0, self.path)
+        self.assertEqual(5, len(load('cens', self.path)[1]))
+        self.assertNotEqual(before, digest('cens', self.path))
+        self.assertEqual(['cens.index.npy', 'cens.npy'], sorted(os.listdir(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+from math import gcd
+
+import scipy.signal
+import soundfile
+
+from observado.lib import utils
+from observado.stream import *
+from observado.stream import _chroma as stream_chroma
+from tests import progression
+
+
+class StreamTestCase(unittest.TestCase):
+    def test_read_blocks(self):
+        with tempfile.TemporaryDirectory() as d:
+            for rate in (22050, 44100, 48000):
+                filename = progression(os.path.join(d, '{}.wav'.format(rate)), seconds=0.5, sr=rate)
+                y = soundfile.read(filename, dtype='float32')[0]
+                expected = scipy.signal.resample_poly(y, sr // gcd(rate, sr), rate // gcd(rate, sr))
+                blocks = list(read_blocks(filename, 1000))
+                self.assertGreater(len(blocks), 1)
+                self.assertTrue(np.allclose(expected, np.concatenate(blocks), atol=1e-6))
+
+    def test_chroma(self):
+        with tempfile.TemporaryDirectory() as d:
+            y = soundfile.read(progression(os.path.join(d, 'a.wav'), seconds=1.), dtype='float32')[0]
+        for n in (40, len(y) // hop):
+            self.assertTrue(np.allclose(utils.features(y[:n * hop], ('cens',), margin=4)['cens'],
+                                        stream_chroma(y[:n * hop]), atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
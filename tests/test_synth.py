@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from observado.lib import utils
+from observado.lib.midi import MIDIChord
+from observado.lib.synth import _notes, render
+
+
+class SynthTestCase(unittest.TestCase):
+    def test_notes(self):
+        # C3 and C4 E4 G4 at velocity 64, a beat being half a second at 120 bpm.
+        self.assertEqual([(0., 4., 48, 64), (1., 4., 60, 64), (2., 4., 64, 64), (3., 4., 67, 64)],
+                         _notes(MIDIChord('C', 0, 1)._content()))
+        # Keys released and pressed again at the same tick
+        notes = _notes(MIDIChord('C', 0, 2)._content())
+        self.assertEqual(12, len(notes))
+        self.assertEqual([(0., 1.), (1., 1.5), (1.5, 2.)], [x[:2] for x in notes if x[2] == 60])
+
+    def test_render(self):
+        y = render(MIDIChord('C'))
+        self.assertEqual(np.float32, y.dtype)
+        # Two seconds held and four times the release of the piano
+        self.assertEqual(int(2.8 * 22050) + 1, len(y))
+        self.assertAlmostEqual(.8, float(np.abs(y).max()), places=5)
+        chroma = utils.features(y, ('cqt',))['cqt'].mean(axis=1)
+        self.assertEqual([0, 4, 7], sorted(np.argsort(chroma)[-3:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from observado import train
+from observado.lib import store
+from observado.lib.chords import Pattern
+from observado.lib.knn import KNN
+
+
+class TrainTestCase(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.chroma = {}
+        for chord in ('C', 'D7', 'Fmaj7', 'Am', 'Em7', 'N'):
+            pattern = Pattern(chord if chord != 'N' else 'C')
+            self.chroma[chord] = pattern.array * (chord != 'N') + np.random.rand(20, 12) * 0.3
+            store.append('cens', self.chroma[chord], [store.record(chord, 0, 0, 'cens')] * 20, self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        x, labels = train.load('cens', True, self.directory.name)
+        self.assertEqual((60, 12), x.shape)
+        # Chords are transposed to C.
+        self.assertTrue(np.allclose(np.roll(self.chroma['D7'], -2, axis=1), x[20:40], atol=1e-6))
+        self.assertEqual([train.qualities[x] for x in ('M', '7', 'maj7')], labels[::20].tolist())
+
+    def test_folds(self):
+        labels = np.repeat([0, 1, 2], [10, 20, 30])
+        fold = train.folds(labels, 5, 0)
+        self.assertTrue(np.array_equal(fold, train.folds(labels, 5, 0)))
+        for label in range(3):
+            self.assertEqual([2 * (label + 1)] * 5, np.bincount(fold[labels == label]).tolist())
+
+    def test_train(self):
+        report = train.train(False, ks=(1, 3), n_folds=4, jobs=1, output=self.directory.name,
+                             features=self.directory.name)
+        self.assertEqual(40, report['samples'])
+        self.assertEqual(4, len(report['grid']))
+        self.assertGreater(report['best']['accuracy'], 0.9)
+        model = KNN.load(os.path.join(self.directory.name, 'minor.npz'))
+        self.assertEqual(report['best']['k'], model.k)
+        with open(os.path.join(self.directory.name, 'minor.report.json'), encoding='utf-8') as f:
+            self.assertEqual(report['best'], json.load(f)['best'])
+
+
+if __name__ == '__main__':
+    unittest.main()
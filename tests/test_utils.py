@@ -9,6 +9,38 @@ class MyTestCase(unittest.TestCase):
         a = np.array([3, 9])
         self.assertTrue(np.array_equal(np.array([[1, 5.5, 12.5], [-17, -12.5, -5.5]]), means(b, a)))
         self.assertTrue(np.array_equal(np.array([8.5, -9.5]), means(b)))
+        np.random.seed(0)
+        c = np.random.rand(12, 500)
+        a = np.array([0, 7, 8, 230, 499])
+        bounds = [0, 0, 7, 8, 230, 499, 499]
+        expected = [[c[i, bounds[j]:bounds[j + 1]].mean() if bounds[j] < bounds[j + 1] else np.nan
+                     for j in range(6)] for i in range(12)]
+        self.assertTrue(np.allclose(expected, means(c, a), equal_nan=True))
+
+    def test_features(self):
+        t = np.arange(22050 * 2) / 22050
+        y = sum(np.sin(2 * np.pi * 261.63 * 2 ** (x / 12) * t) for x in (0, 4, 7)).astype(np.float32)
+        data = features(y, ('cqt', 'stft', 'cens', 'enhanced_cqt'))
+        self.assertEqual(['cqt', 'enhanced_cqt', 'cens', 'stft'], list(data.keys()))
+        for x in data.values():
+            self.assertEqual((12, 1 + len(y) // 512), x.shape)
+            self.assertEqual([0, 4, 7], sorted(np.argsort(x.mean(axis=1))[-3:]))
+
+    def test_nn_filter(self):
+        np.random.seed(0)
+        for n in (1, 5, 40, 300):
+            y = np.random.rand(12, n)
+            expected = librosa.decompose.nn_filter(y, aggregate=np.median, metric='cosine') if n > 1 else y
+            self.assertTrue(np.allclose(expected, nn_filter(y, block=64)))
+        # Beyond the window, neighbours are the nearest frames of the window around each frame.
+        y = np.random.rand(12, 100)
+        unit = y / np.linalg.norm(y, axis=0)
+        expected = np.empty_like(y)
+        for i in range(100):
+            frames = np.array([x for x in range(100) if 0 < abs(x - i) <= 20])
+            nearest = frames[np.argsort(1 - unit[:, frames].T.dot(unit[:, i]), kind='stable')[:16]]
+            expected[:, i] = np.median(y[:, np.sort(nearest)[:14]], axis=1)
+        self.assertTrue(np.allclose(expected, nn_filter(y, window=20, block=16)))
 
 
 if __name__ == '__main__':
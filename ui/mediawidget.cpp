@@ -237,6 +237,7 @@ void MediaWidget::setTable()
 }
 
 // Non-blocking by child process.
+// The child is a thin client of the analysis server, which keeps the models loaded between files.
 // I failed when trying multithreading with condition variables.
 // This may not be the best practice.
 void MediaWidget::run()
@@ -245,7 +246,7 @@ void MediaWidget::run()
 #ifdef __FILE__
     QDir dir(__FILE__);
     if (dir.cdUp() && dir.cdUp()) {
-        QFile script(dir.filePath("main.py"));
+        QFile script(dir.filePath("client.py"));
         if (script.exists())
             params << script.fileName();
     }
@@ -253,11 +254,11 @@ void MediaWidget::run()
 #ifdef WIN32
     QString python = "python";
     if (params.isEmpty())
-        params << ".\\main.py";
+        params << ".\\client.py";
 #else
     QString python = "python3";
     if (params.isEmpty())
-        params << "main.py";
+        params << "client.py";
 #endif
     auto process = new QProcess(this);
     params << fileUrl.toLocalFile();